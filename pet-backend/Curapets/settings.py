@@ -63,6 +63,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'Curapets.urls'
 
+TEST_RUNNER = 'utils.test_runner.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -83,6 +85,18 @@ WSGI_APPLICATION = 'Curapets.wsgi.application'
 ASGI_APPLICATION = 'Curapets.asgi.application'
 
 
+# Shared cache for throttling and public response caching. Every process must
+# see the same cache, or one process's invalidation leaves the others serving
+# stale responses, so it defaults to the Redis the channel layer uses (its own
+# database there). The test runner swaps in an in-memory cache.
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='redis://redis:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    }
+}
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
@@ -92,6 +106,15 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Unread notifications of the same verb to the same recipient within this many
+# seconds are merged into one row and one WebSocket frame; 0 turns it off
+NOTIFICATION_COALESCE_SECONDS = config('NOTIFICATION_COALESCE_SECONDS', default=0, cast=int)
+# Retention applied by the purge_notifications command: unread rows plus each user's
+# newest NOTIFICATION_KEEP_READ read rows are kept, and with NOTIFICATION_MAX_AGE_DAYS
+# set nothing older than that
+NOTIFICATION_KEEP_READ = config('NOTIFICATION_KEEP_READ', default=200, cast=int)
+NOTIFICATION_MAX_AGE_DAYS = config('NOTIFICATION_MAX_AGE_DAYS', default=0, cast=int)
+
 SECURE_HSTS_SECONDS = 31536000
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
@@ -142,6 +165,10 @@ cloudinary.config(
     api_secret=CLOUDINARY_API_SECRET
 )
 
+# Backend the media deletion dispatcher (doctor.media) deletes files through;
+# doctor.tests.media.LocalMedia stands in for Cloudinary in tests
+MEDIA_DELETE_BACKEND = config('MEDIA_DELETE_BACKEND', default='doctor.media.CloudinaryMedia')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -184,6 +211,10 @@ REST_FRAMEWORK = {
     
 }
 
+# Per-action query budgets (utils.queries.QueryBudgetMixin) raise when strict and only log otherwise;
+# the test runner turns this on
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+
 
 
 SIMPLE_JWT = {
@@ -1,3 +1,7 @@
 from django.contrib import admin
-from .models import Appointment
-admin.site.register(Appointment)
\ No newline at end of file
+from .models import Appointment, AppointmentSeries, ArchivedAppointment, DoctorDailyStats, SlotHold
+admin.site.register(Appointment)
+admin.site.register(AppointmentSeries)
+admin.site.register(ArchivedAppointment)
+admin.site.register(DoctorDailyStats)
+admin.site.register(SlotHold)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from contextvars import ContextVar
+from datetime import date, timedelta
+from django.db import transaction
+from django.db.models import F
+from notifications.models import Notification
+from .models import Appointment, ArchivedAppointment
+
+ARCHIVE_BATCH_SIZE = 1000
+# True while archive_batch deletes the rows it has copied; see appointments.signals
+archiving = ContextVar('archiving', default=False)
+
+
+def archivable(older_than_days, today=None):
+    """Terminal-state appointments dated more than older_than_days ago."""
+    cutoff = (today or date.today()) - timedelta(days=older_than_days)
+    return Appointment.objects.filter(status__in=ArchivedAppointment.TERMINAL_STATUSES, date__lt=cutoff)
+
+
+def archive_batch(queryset, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Moves up to batch_size appointments from queryset into the archive in one
+    transaction: copy the rows, point their notifications at the archived
+    copies, then delete the originals. A batch either moves completely or not
+    at all, so an interrupted run is resumed simply by running it again.
+
+    Returns the number of appointments moved.
+    """
+    with transaction.atomic():
+        rows = list(queryset.order_by('id').values(*ArchivedAppointment.COPIED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+
+        ArchivedAppointment.objects.bulk_create([ArchivedAppointment(**row) for row in rows])
+        notifications = Notification.objects.filter(appointment_id__in=ids)
+        notifications.update(archived_appointment_id=F('appointment_id'))
+        Notification.objects.filter(archived_appointment_id__in=ids).update(appointment=None)
+        # The appointments still exist in the archive (DoctorDailyStats keeps
+        # counting them) and are long past, so the post_delete receivers skip them
+        token = archiving.set(True)
+        try:
+            Appointment.objects.filter(pk__in=ids).delete()
+        finally:
+            archiving.reset(token)
+    return len(ids)
@@ -0,0 +1,149 @@
+import hashlib
+import secrets
+from datetime import date, datetime, timedelta
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import Count, Max
+from doctor.availability import DEFAULT_SLOT_MINUTES
+from .models import Appointment
+
+CALENDAR_TOKEN_SALT = 'appointments.calendar'
+# Past appointments older than this are left out of the feed
+CALENDAR_PAST_DAYS = 30
+CALENDAR_CHUNK_SIZE = 500
+
+# Appointment status -> iCalendar VEVENT STATUS
+EVENT_STATUS = {
+    'pending': 'TENTATIVE',
+    'accepted': 'CONFIRMED',
+    'rejected': 'CANCELLED',
+    'completed': 'CONFIRMED',
+    'expired': 'CANCELLED',
+}
+
+FEED_FIELDS = (
+    'id', 'date', 'time', 'status', 'title', 'reason', 'updated_at', 'pet__name',
+    'user__firstname', 'user__lastname', 'doctor__firstname', 'doctor__lastname',
+)
+
+
+def calendar_token(user):
+    """
+    Signed, URL-safe token identifying the owner of a calendar feed. It
+    carries the user's calendar_secret, so rotating the secret revokes it.
+    """
+    return signing.dumps([str(user.pk), user.calendar_secret], salt=CALENDAR_TOKEN_SALT)
+
+
+def calendar_user(token):
+    """
+    The active user a calendar token was issued for, from one query, or None
+    if the token is not valid or its secret has been rotated since.
+    """
+    try:
+        user_id, secret = signing.loads(token, salt=CALENDAR_TOKEN_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return get_user_model().objects.filter(pk=user_id, calendar_secret=secret, is_active=True).first()
+
+
+def rotate_calendar_secret(user):
+    """Gives the user a new calendar_secret, revoking every feed link issued so far."""
+    user.calendar_secret = secrets.token_urlsafe(24)
+    user.save(update_fields=['calendar_secret'])
+
+
+def feed_queryset(user, today=None):
+    """Appointments shown in the user's feed: their bookings, or a doctor's patients."""
+    since = (today or date.today()) - timedelta(days=CALENDAR_PAST_DAYS)
+    if user.role == 'doctor':
+        queryset = Appointment.objects.filter(doctor=user)
+    else:
+        queryset = Appointment.objects.filter(user=user)
+    return queryset.filter(date__gte=since)
+
+
+def feed_version(user, queryset):
+    """
+    (etag, last_modified) for a feed from one aggregate query. The row count
+    is part of the ETag so deletions, which leave no updated_at behind, still
+    change it.
+    """
+    stats = queryset.aggregate(count=Count('id'), latest=Max('updated_at'))
+    key = f"{user.pk}:{stats['count']}:{stats['latest'].isoformat() if stats['latest'] else ''}"
+    return hashlib.md5(key.encode()).hexdigest(), stats['latest']
+
+
+def escape_text(value):
+    """Escapes a TEXT property value (RFC 5545, 3.3.11)."""
+    return (
+        value.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Folds a content line at 75 octets, continuation lines starting with a space."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a multi-byte character
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    parts.append(encoded.decode())
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def render_event(row, stamp):
+    start = datetime.combine(row['date'], row['time'])
+    if row['title']:
+        summary = row['title']
+    else:
+        summary = f"Appointment for {row['pet__name'] or 'a pet'}"
+    description = (
+        f"Pet owner: {row['user__firstname']} {row['user__lastname']}\n"
+        f"Doctor: Dr. {row['doctor__firstname']} {row['doctor__lastname']}"
+    )
+    if row['reason']:
+        description += f"\nReason: {row['reason']}"
+
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:appointment-{row['id']}@curapets",
+        f"DTSTAMP:{stamp}",
+        f"LAST-MODIFIED:{row['updated_at'].strftime('%Y%m%dT%H%M%SZ')}",
+        f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+        f"DURATION:PT{DEFAULT_SLOT_MINUTES}M",
+        f"SUMMARY:{escape_text(summary)}",
+        f"DESCRIPTION:{escape_text(description)}",
+        f"STATUS:{EVENT_STATUS.get(row['status'], 'TENTATIVE')}",
+        'END:VEVENT',
+    ]
+    return ''.join(fold(line) for line in lines)
+
+
+def iter_calendar(queryset, name, stamp):
+    """
+    Yields the iCalendar document for the queryset chunk by chunk, reading
+    plain values() rows through a server-side iterator so memory stays flat
+    however many appointments the feed holds.
+    """
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Curapets//Appointments//EN',
+        'CALSCALE:GREGORIAN',
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ])
+    rows = queryset.order_by('date', 'time', 'id').values(*FEED_FIELDS)
+    for row in rows.iterator(chunk_size=CALENDAR_CHUNK_SIZE):
+        yield render_event(row, stamp)
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,74 @@
+from collections import Counter, defaultdict
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from notifications.utils import create_notifications_bulk
+from .models import Appointment, DoctorDailyStats
+
+EXPIRY_BATCH_SIZE = 500
+
+User = get_user_model()
+
+
+def stale_pending(today=None):
+    """Pending appointments whose date has passed without the doctor answering."""
+    return Appointment.objects.filter(status='pending', date__lt=today or date.today())
+
+
+def expire_batch(queryset, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Marks up to batch_size appointments from queryset as expired with one
+    UPDATE, so no per-row post_save fires. What the receivers would do is
+    done once for the batch instead: one DoctorDailyStats adjustment and one
+    coalesced notification per pet owner and doctor pair.
+
+    Returns the number of appointments expired, which leaves out any that
+    stopped being pending after they were selected.
+    """
+    with transaction.atomic():
+        # Locked so a doctor answering a request meanwhile can't be overwritten
+        appointments = list(
+            queryset.select_for_update(skip_locked=True)
+            .order_by('id')
+            .only('id', 'user_id', 'doctor_id', 'date', 'time', 'status')[:batch_size]
+        )
+        if not appointments:
+            return 0
+
+        # select_for_update is a no-op on SQLite, so the UPDATE itself only
+        # takes rows that are still pending; a request the doctor answered
+        # meanwhile keeps its answer. The rows changed are read back by the
+        # updated_at they were given, and only they are counted and announced.
+        now = timezone.now()
+        Appointment.objects.filter(
+            pk__in=[appointment.id for appointment in appointments], status='pending'
+        ).update(status='expired', updated_at=now)
+        changed = set(Appointment.objects.filter(
+            pk__in=[appointment.id for appointment in appointments], status='expired', updated_at=now
+        ).values_list('id', flat=True))
+        appointments = [appointment for appointment in appointments if appointment.id in changed]
+        if not appointments:
+            return 0
+
+        deltas = Counter()
+        by_pair = defaultdict(list)
+        for appointment in appointments:
+            deltas[appointment.stats_key()] -= 1
+            appointment.status = 'expired'
+            deltas[appointment.stats_key()] += 1
+            by_pair[(appointment.user_id, appointment.doctor_id)].append(appointment)
+        DoctorDailyStats.apply(deltas)
+
+        users = User.objects.in_bulk({user_id for pair in by_pair for user_id in pair})
+        for (user_id, doctor_id), expired in by_pair.items():
+            create_notifications_bulk(
+                recipient=users[user_id],
+                verb="did not respond to your appointment request",
+                actor=users[doctor_id],
+                items=[
+                    (appointment, f"on {appointment.date} at {appointment.time}, which has expired")
+                    for appointment in expired
+                ]
+            )
+    return len(appointments)
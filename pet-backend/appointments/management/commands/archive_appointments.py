@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from appointments.archive import ARCHIVE_BATCH_SIZE, archivable, archive_batch
+
+class Command(BaseCommand):
+    help = 'Move completed, rejected and expired appointments older than --older-than days into the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=365, help='Age in days, by appointment date')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Appointments moved per transaction')
+
+    def handle(self, *args, **options):
+        queryset = archivable(options['older_than'])
+        total = 0
+        while True:
+            moved = archive_batch(queryset, options['batch_size'])
+            total += moved
+            if moved:
+                self.stdout.write(f"Archived {total} appointments so far...")
+            if moved < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} appointments."))
@@ -0,0 +1,60 @@
+import time as clock
+import uuid
+from datetime import date, time, timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from appointments.models import Appointment
+from appointments.serializers import AppointmentSerializer, AppointmentReadSerializer
+from pets.models import Pet
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = (
+        'Compare the per-row rendering cost of AppointmentSerializer and '
+        'AppointmentReadSerializer on in-memory rows (no database access)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Row counts to measure')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is reported')
+
+    def build(self, count):
+        owner = User(id=uuid.uuid4(), firstname="Pat", lastname="Owner", email="owner@example.com")
+        doctor = User(id=uuid.uuid4(), firstname="Ada", lastname="Vet", email="vet@example.com", role='doctor')
+        pet = Pet(id=1, owner=owner, name="Bella", species="dog", age=2, image='pet_images/bella.jpg')
+        today = date.today()
+        created_at = timezone.now()
+
+        appointments = []
+        for i in range(count):
+            appointment = Appointment(
+                id=i + 1, user=owner, doctor=doctor, pet=pet if i % 4 else None,
+                title="Checkup", reason="Annual visit", date=today + timedelta(days=i % 30),
+                time=time(9 + i % 8, 30 * (i % 2)), status='accepted', created_at=created_at
+            )
+            appointments.append(appointment)
+        return appointments, [AppointmentReadSerializer.row_from_instance(a) for a in appointments]
+
+    def best_of(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            start = clock.perf_counter()
+            func()
+            elapsed = clock.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'rows':>8} {'serializer us/row':>18} {'fast path us/row':>17} {'speedup':>8}")
+        for count in options['rows']:
+            appointments, rows = self.build(count)
+            if AppointmentSerializer(appointments, many=True).data != AppointmentReadSerializer().serialize(rows):
+                raise CommandError("AppointmentReadSerializer output differs from AppointmentSerializer.")
+
+            slow = self.best_of(options['repeat'], lambda: AppointmentSerializer(appointments, many=True).data)
+            fast = self.best_of(options['repeat'], lambda: AppointmentReadSerializer().serialize(rows))
+            self.stdout.write(
+                f"{count:>8} {slow / count * 1e6:>18.2f} {fast / count * 1e6:>17.2f} {slow / fast:>7.1f}x"
+            )
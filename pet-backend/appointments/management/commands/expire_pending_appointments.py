@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from appointments.expiry import EXPIRY_BATCH_SIZE, expire_batch, stale_pending
+
+class Command(BaseCommand):
+    help = 'Mark pending appointments whose date has passed as expired (run daily, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE, help='Appointments expired per UPDATE')
+
+    def handle(self, *args, **options):
+        queryset = stale_pending()
+        total = 0
+        while True:
+            expired = expire_batch(queryset, options['batch_size'])
+            total += expired
+            # A short batch may only have lost rows to doctors answering meanwhile
+            if not expired:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Expired {total} stale pending appointments."))
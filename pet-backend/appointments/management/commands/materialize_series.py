@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError
+from appointments.models import AppointmentSeries
+from appointments.series import SERIES_WINDOW_DAYS, materialize_series
+
+class Command(BaseCommand):
+    help = 'Create Appointment rows for recurring series occurrences inside the rolling window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=SERIES_WINDOW_DAYS, help='Window size in days')
+
+    def handle(self, *args, **options):
+        until = date.today() + timedelta(days=options['days'])
+        # Series whose window already reaches `until` have nothing to add
+        series_list = AppointmentSeries.objects.filter(status='active').exclude(
+            materialized_until__gte=until
+        ).select_related('user', 'doctor__profile', 'pet')
+
+        created = skipped = failed = 0
+        for series in series_list.iterator(chunk_size=200):
+            try:
+                new, missed = materialize_series(series, until)
+            except IntegrityError:
+                # Raced with a booking; the next run retries the whole window
+                failed += 1
+                continue
+            created += len(new)
+            skipped += missed
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} appointments from recurring series, skipped {skipped} unavailable occurrences."
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} series lost a slot to a concurrent booking; rerun to retry."))
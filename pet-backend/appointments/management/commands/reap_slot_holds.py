@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from appointments.models import SlotHold
+
+class Command(BaseCommand):
+    help = 'Delete expired appointment slot holds'
+
+    def handle(self, *args, **kwargs):
+        deleted = SlotHold.reap_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired slot holds."))
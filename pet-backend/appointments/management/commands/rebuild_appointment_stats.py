@@ -0,0 +1,24 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from appointments.models import Appointment, ArchivedAppointment, DoctorDailyStats
+
+class Command(BaseCommand):
+    help = 'Recompute DoctorDailyStats from the appointments table and its archive'
+
+    def handle(self, *args, **kwargs):
+        counts = defaultdict(dict)
+        for model in (Appointment, ArchivedAppointment):
+            grouped = model.objects.values('doctor_id', 'date', 'status').annotate(total=Count('id')).order_by()
+            for row in grouped.iterator():
+                by_status = counts[(row['doctor_id'], row['date'])]
+                by_status[row['status']] = by_status.get(row['status'], 0) + row['total']
+
+        with transaction.atomic():
+            DoctorDailyStats.objects.all().delete()
+            DoctorDailyStats.objects.bulk_create([
+                DoctorDailyStats(doctor_id=doctor_id, date=day, **by_status)
+                for (doctor_id, day), by_status in counts.items()
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {len(counts)} doctor days."))
@@ -1,5 +1,11 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest
+from collections import Counter
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+import calendar
 from pets.models import Pet
 
 class Appointment(models.Model):
@@ -8,6 +14,7 @@ class Appointment(models.Model):
         ('accepted', 'Accepted'),
         ('rejected', 'Rejected'),
         ('completed', 'Completed'),
+        ('expired', 'Expired'),
     ]
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -28,13 +35,339 @@ class Appointment(models.Model):
     )
     title = models.CharField(max_length=100, blank=True)
     reason = models.TextField(blank=True)  
+    series = models.ForeignKey(
+        'AppointmentSeries',
+        on_delete=models.SET_NULL,
+        related_name='appointments',
+        null=True,
+        blank=True
+    )
     date = models.DateField()
     time = models.TimeField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Drives the calendar feed's ETag/Last-Modified; queryset .update() calls must set it too
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('doctor', 'date', 'time')  
+        indexes = [
+            # Doctor dashboards: today's accepted list and the pending request queue
+            models.Index(fields=['doctor', 'status', 'date', 'time'], name='appt_doctor_status_date_idx'),
+            # Patient side: upcoming accepted appointments
+            models.Index(fields=['user', 'status', 'date', 'time'], name='appt_user_status_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title or 'Appointment'} on {self.date} at {self.time} with Dr. {self.doctor.firstname}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the row counted towards in DoctorDailyStats when it was loaded
+        instance._stats_key = instance.stats_key()
+        # The doctor whose next open slot the row affected when it was loaded
+        instance._loaded_doctor_id = instance.doctor_id
+        return instance
+
+    def stats_key(self):
+        return (self.doctor_id, self.date, self.status)
+
+    def booking_target(self):
+        """Notification target text for a new booking."""
+        return f"for {self.pet.name if self.pet else 'a pet'} on {self.date} at {self.time}"
+
+
+class DoctorDailyStats(models.Model):
+    """
+    Appointment counts per doctor, day and status, kept current in the same
+    transaction as every booking, status change and deletion (see
+    appointments.signals), so dashboards read a few precomputed rows instead
+    of counting appointments. Rebuild with manage.py rebuild_appointment_stats.
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    date = models.DateField()
+    # One counter per Appointment status, named after it
+    pending = models.PositiveIntegerField(default=0)
+    accepted = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    expired = models.PositiveIntegerField(default=0)
+
+    STATUSES = [value for value, _ in Appointment.STATUS_CHOICES]
+
+    class Meta:
+        unique_together = ('doctor', 'date')
+
+    def __str__(self):
+        return f"Stats for Dr. {self.doctor_id} on {self.date}"
+
+    @classmethod
+    def apply(cls, deltas):
+        """
+        Applies a Counter of {(doctor_id, date, status): change}. Missing rows
+        for increments are inserted in one statement, then each (doctor, date)
+        gets one UPDATE with F() expressions, so concurrent writers never
+        overwrite each other's counts. Decrements stop at zero: a row the
+        counters never saw (bulk_create without record_created, or older than
+        its stats row) must not fail a later status change.
+        """
+        changes = {}
+        for (doctor_id, day, status), delta in deltas.items():
+            if delta:
+                changes.setdefault((doctor_id, day), {})[status] = delta
+        if not changes:
+            return
+
+        with transaction.atomic():
+            # Decrements never create rows: a doctor being deleted must not get new ones
+            cls.objects.bulk_create([
+                cls(doctor_id=doctor_id, date=day)
+                for (doctor_id, day), counts in changes.items()
+                if any(delta > 0 for delta in counts.values())
+            ], ignore_conflicts=True)
+            for (doctor_id, day), counts in changes.items():
+                cls.objects.filter(doctor_id=doctor_id, date=day).update(**{
+                    status: F(status) + delta if delta > 0 else Greatest(F(status) + delta, 0)
+                    for status, delta in counts.items()
+                })
+
+    @classmethod
+    def record_created(cls, appointments):
+        """Counts appointments inserted without post_save, e.g. by bulk_create."""
+        cls.apply(Counter(appointment.stats_key() for appointment in appointments))
+
+
+
+class ArchivedAppointment(models.Model):
+    """
+    Cold storage for appointments in a terminal state (completed, rejected or
+    expired) well in the past, moved out by manage.py archive_appointments so
+    the hot table and its indexes only hold live bookings. Rows keep their
+    original id, and notifications follow them through
+    Notification.archived_appointment.
+    """
+    TERMINAL_STATUSES = ('completed', 'rejected', 'expired')
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_appointments'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_doctor_appointments'
+    )
+    pet = models.ForeignKey(
+        Pet,
+        on_delete=models.CASCADE,
+        related_name='archived_appointments',
+        null=True,
+        blank=True
+    )
+    title = models.CharField(max_length=100, blank=True)
+    reason = models.TextField(blank=True)
+    series = models.ForeignKey(
+        'AppointmentSeries',
+        on_delete=models.SET_NULL,
+        related_name='archived_appointments',
+        null=True,
+        blank=True
+    )
+    date = models.DateField()
+    time = models.TimeField()
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # Columns copied over from Appointment as they are
+    COPIED_FIELDS = (
+        'id', 'user_id', 'doctor_id', 'pet_id', 'title', 'reason', 'series_id',
+        'date', 'time', 'status', 'created_at', 'updated_at',
+    )
+
+    class Meta:
+        indexes = [
+            # History pages, newest first
+            models.Index(fields=['doctor', 'date', 'time'], name='archived_appt_doctor_idx'),
+            models.Index(fields=['user', 'date', 'time'], name='archived_appt_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.title or 'appointment'} on {self.date} at {self.time}"
+
+class SlotHold(models.Model):
+    """
+    A short-lived reservation of (doctor, date, time) taken before booking, so
+    racing clients learn the slot is gone from one unique-key lookup instead of
+    losing on the appointment insert after full validation.
+    """
+    TTL = timedelta(minutes=5)
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='slot_holds'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='held_slots'
+    )
+    date = models.DateField()
+    time = models.TimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date', 'time')
 
     def __str__(self):
-        return f"{self.title or 'Appointment'} on {self.date} at {self.time} with Dr. {self.doctor.firstname}"
\ No newline at end of file
+        return f"Hold on {self.date} at {self.time} with Dr. {self.doctor_id} until {self.expires_at}"
+
+    @classmethod
+    def acquire(cls, user, doctor, date, time):
+        """
+        Takes or renews a hold on the slot. Returns the hold, or None when
+        another user holds it and the hold has not expired.
+        """
+        now = timezone.now()
+        expires_at = now + cls.TTL
+        try:
+            with transaction.atomic():
+                return cls.objects.create(user=user, doctor=doctor, date=date, time=time, expires_at=expires_at)
+        except IntegrityError:
+            pass
+        # The slot has a hold already: take it over if it is ours or has expired
+        taken = cls.objects.filter(doctor=doctor, date=date, time=time).filter(
+            models.Q(user=user) | models.Q(expires_at__lte=now)
+        ).update(user=user, expires_at=expires_at, created_at=now)
+        if not taken:
+            return None
+        return cls.objects.get(doctor=doctor, date=date, time=time)
+
+    @classmethod
+    def held_by_others(cls, user, doctor_id, dates):
+        """
+        The (date, time) slots of the doctor on any of dates that someone
+        other than user holds right now, from one query. Every booking path
+        (single, batch and series) checks its slots against this.
+        """
+        return set(cls.objects.filter(
+            doctor_id=doctor_id, date__in=dates, expires_at__gt=timezone.now()
+        ).exclude(user=user).values_list('date', 'time'))
+
+    @classmethod
+    def reap_expired(cls):
+        """Deletes every expired hold in a single statement and returns how many went."""
+        deleted, _ = cls.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+def add_months(day, months):
+    """Shifts a date by whole months, clamping to the last day of shorter months."""
+    year, month = divmod(day.month - 1 + months, 12)
+    year += day.year
+    month += 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+class AppointmentSeries(models.Model):
+    """
+    A recurring visit for one pet with one doctor. Occurrences become real
+    Appointment rows lazily, a rolling window at a time (see appointments.series).
+    """
+    FREQUENCY_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('cancelled', 'Cancelled'),
+    ]
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='appointment_series'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='doctor_appointment_series'
+    )
+    pet = models.ForeignKey(
+        Pet,
+        on_delete=models.CASCADE,
+        related_name='appointment_series',
+        null=True,
+        blank=True
+    )
+    title = models.CharField(max_length=100, blank=True)
+    reason = models.TextField(blank=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1)  # every N weeks/months
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    time = models.TimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    # Occurrences up to and including this date exist as Appointment rows
+    materialized_until = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'materialized_until'], name='series_status_window_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} {self.title or 'appointment'} from {self.start_date} at {self.time}"
+
+    def occurrence(self, k):
+        """The k-th occurrence date (0-based)."""
+        if self.frequency == 'weekly':
+            return self.start_date + timedelta(weeks=k * self.interval)
+        return add_months(self.start_date, k * self.interval)
+
+    def occurrences_between(self, start, end):
+        """
+        Occurrence dates in [start, end]. The first index is computed from the
+        rule directly, so the cost depends on the window, not the series age.
+        """
+        start = max(start, self.start_date)
+        if self.end_date:
+            end = min(end, self.end_date)
+        if start > end:
+            return []
+
+        if self.frequency == 'weekly':
+            k = -(-(start - self.start_date).days // (7 * self.interval))
+        else:
+            months = (start.year - self.start_date.year) * 12 + start.month - self.start_date.month
+            k = max(0, months // self.interval)
+            if self.occurrence(k) < start:
+                k += 1
+
+        dates = []
+        day = self.occurrence(k)
+        while day <= end:
+            dates.append(day)
+            k += 1
+            day = self.occurrence(k)
+        return dates
+
+    def next_unmaterialized(self, today):
+        """First occurrence after the materialized window, or None when the series is over."""
+        start = today
+        if self.materialized_until and self.materialized_until >= today:
+            start = self.materialized_until + timedelta(days=1)
+        # One rule period always contains the next occurrence
+        span = timedelta(weeks=self.interval) if self.frequency == 'weekly' else timedelta(days=31 * self.interval)
+        dates = self.occurrences_between(start, start + span)
+        return dates[0] if dates else None
@@ -1,15 +1,54 @@
 from rest_framework import serializers
-from .models import Appointment
+from .models import Appointment, AppointmentSeries, SlotHold
 from pets.models import Pet
 from django.contrib.auth import get_user_model
 from datetime import datetime, date
+from operator import itemgetter
 from django.utils import timezone
 
 User = get_user_model()
 
+def validate_schedule(doctor_profile, appointment_date, appointment_time):
+    """
+    Raises ValidationError unless the date is not in the past and the time
+    falls within the doctor's available slots for that weekday.
+    """
+    if appointment_date < date.today():
+        raise serializers.ValidationError("Cannot schedule appointments in the past.")
+
+    available_days = doctor_profile.available_days or []
+    weekday = appointment_date.strftime('%A')
+
+    if weekday not in available_days:
+        raise serializers.ValidationError(f"Doctor is not available on {weekday}.")
+
+    try:
+        availability_index = doctor_profile.get_availability_index()
+    except ValueError as e:
+        raise serializers.ValidationError(str(e))
+
+    if not availability_index.get(weekday):
+        raise serializers.ValidationError(f"Doctor has no available time slots on {weekday}.")
+
+    if not doctor_profile.is_available_at(appointment_date, appointment_time):
+        raise serializers.ValidationError(
+            f"Selected time {appointment_time} is not within available slots on {weekday}."
+        )
+
+class AppointmentTimeField(serializers.TimeField):
+    """Accepts a plain time on write and renders the combined date and time on read."""
+
+    def get_attribute(self, instance):
+        return instance
+
+    def to_representation(self, obj):
+        return self.parent.get_time(obj)
+
 class AppointmentSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    doctor = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='doctor'))
+    doctor = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(role='doctor').select_related('profile')
+    )
     pet = serializers.PrimaryKeyRelatedField(queryset=Pet.objects.all(), allow_null=True)
     
     # Custom fields for frontend
@@ -17,16 +56,16 @@ class AppointmentSerializer(serializers.ModelSerializer):
     petImage = serializers.CharField(source='pet.image', read_only=True, allow_null=True)
     patientName = serializers.SerializerMethodField()
     doctorName = serializers.CharField(source='doctor.firstname', read_only=True)
-    time = serializers.SerializerMethodField()  # Combined date and time
+    time = AppointmentTimeField()  # Combined date and time
 
     class Meta:
         model = Appointment
         fields = [
             'id', 'pet', 'petName', 'petImage', 'user', 'patientName', 
             'doctor', 'doctorName', 'title', 'reason', 'date', 'time', 
-            'status', 'created_at'
+            'status', 'series', 'created_at'
         ]
-        read_only_fields = ['created_at', 'petName', 'petImage', 'patientName', 'doctorName', 'time']
+        read_only_fields = ['created_at', 'petName', 'petImage', 'patientName', 'doctorName', 'series']
 
     def get_patientName(self, obj):
         return f"{obj.user.firstname} {obj.user.lastname}"
@@ -50,47 +89,22 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return f"{prefix}, {time_str}"
 
     def validate(self, data):
-        doctor = data['doctor']
-        appointment_date = data['date']
-        appointment_time = data['time']
-        
-        # Ensure date is not in the past
-        if appointment_date < date.today():
-            raise serializers.ValidationError("Cannot schedule appointments in the past.")
+        instance = self.instance
+        # Status-only updates don't reschedule, so there is nothing to check
+        if instance and not {'doctor', 'date', 'time'} & data.keys():
+            return data
 
+        doctor = data.get('doctor', getattr(instance, 'doctor', None))
+        appointment_date = data.get('date', getattr(instance, 'date', None))
+        appointment_time = data.get('time', getattr(instance, 'time', None))
+        
         # Validate doctor's availability
         try:
             doctor_profile = doctor.profile
         except User.profile.RelatedObjectDoesNotExist:
             raise serializers.ValidationError("Doctor profile not found.")
-        
-        available_days = doctor_profile.available_days or []
-        available_times = doctor_profile.available_times or {}
-        weekday = appointment_date.strftime('%A')
-
-        if weekday not in available_days:
-            raise serializers.ValidationError(f"Doctor is not available on {weekday}.")
-
-        available_slots = available_times.get(weekday, [])
-        if not available_slots:
-            raise serializers.ValidationError(f"Doctor has no available time slots on {weekday}.")
-
-        is_valid_time = False
-        for slot in available_slots:
-            if not isinstance(slot, dict) or 'from' not in slot or 'to' not in slot:
-                raise serializers.ValidationError(f"Invalid time slot format: {slot}")
-            
-            slot_from = datetime.strptime(slot['from'], '%H:%M').time()
-            slot_to = datetime.strptime(slot['to'], '%H:%M').time()
-
-            if slot_from <= appointment_time <= slot_to:
-                is_valid_time = True
-                break
-
-        if not is_valid_time:
-            raise serializers.ValidationError(
-                f"Selected time {appointment_time} is not within available slots on {weekday}."
-            )
+
+        validate_schedule(doctor_profile, appointment_date, appointment_time)
 
         return data
 
@@ -110,4 +124,164 @@ class AppointmentSerializer(serializers.ModelSerializer):
             if field not in allowed_fields:
                 raise serializers.ValidationError(f"You cannot update the '{field}' field.")
 
-        return super().update(instance, validated_data)
\ No newline at end of file
+        return super().update(instance, validated_data)
+
+class AppointmentReadSerializer:
+    """
+    Read-only fast path for list actions that renders exactly the JSON of
+    AppointmentSerializer from values_list() tuples instead of model
+    instances. "Today"/"Tomorrow" is resolved once per response, and the
+    date and time labels are cached, since a list repeats the same few
+    dates and slot times.
+
+        rows = AppointmentReadSerializer.values(queryset)
+        data = AppointmentReadSerializer().serialize(rows)
+    """
+    FIELDS = (
+        'id', 'pet_id', 'pet__name', 'pet__image', 'user__firstname', 'user__lastname',
+        'doctor_id', 'doctor__firstname', 'title', 'reason', 'date', 'time', 'status',
+        'series_id', 'created_at',
+    )
+    # Orders rows by (date, time), e.g. to merge row streams
+    SORT_KEY = itemgetter(FIELDS.index('date'), FIELDS.index('time'))
+
+    def __init__(self, today=None):
+        self.today = today or timezone.now().date()
+        self.tomorrow = self.today + timezone.timedelta(days=1)
+        self.date_field = serializers.DateField()
+        self.datetime_field = serializers.DateTimeField()
+        self.date_labels = {}
+        self.time_labels = {}
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values_list(*cls.FIELDS)
+
+    @staticmethod
+    def row_from_instance(obj):
+        """Row tuple for a model instance, e.g. an unsaved projected occurrence."""
+        pet = obj.pet
+        return (
+            obj.id, obj.pet_id, pet.name if pet else None, pet.image.name if pet else None,
+            obj.user.firstname, obj.user.lastname, obj.doctor_id, obj.doctor.firstname,
+            obj.title, obj.reason, obj.date, obj.time, obj.status, obj.series_id, obj.created_at,
+        )
+
+    def date_label(self, value):
+        label = self.date_labels.get(value)
+        if label is None:
+            if value == self.today:
+                label = "Today"
+            elif value == self.tomorrow:
+                label = "Tomorrow"
+            else:
+                label = value.strftime("%b %d, %Y")
+            self.date_labels[value] = label
+        return label
+
+    def time_label(self, value):
+        label = self.time_labels.get(value)
+        if label is None:
+            label = self.time_labels[value] = value.strftime("%I:%M %p").lstrip("0")
+        return label
+
+    def to_representation(self, row):
+        (pk, pet_id, pet_name, pet_image, firstname, lastname, doctor_id, doctor_name,
+         title, reason, day, time, status, series_id, created_at) = row
+        has_pet = pet_id is not None
+        data = {
+            'id': pk,
+            'pet': pet_id,
+            'petName': pet_name,
+            # ImageField renders through str(FieldFile), which is '' when no file is set
+            'petImage': (pet_image or '') if has_pet else None,
+            'patientName': f"{firstname} {lastname}",
+            'doctor': doctor_id,
+            'doctorName': doctor_name,
+            'title': title,
+            'reason': reason,
+            'date': self.date_field.to_representation(day),
+            'time': f"{self.date_label(day)}, {self.time_label(time)}",
+            'status': status,
+            'series': series_id,
+            'created_at': self.datetime_field.to_representation(created_at) if created_at else None,
+        }
+        if not has_pet:
+            # AppointmentSerializer skips petName when the source pet.name can't be reached
+            del data['petName']
+        return data
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+class AppointmentBatchItemSerializer(serializers.Serializer):
+    pet = serializers.IntegerField(allow_null=True, required=False)
+    title = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    reason = serializers.CharField(required=False, allow_blank=True)
+    date = serializers.DateField()
+    time = serializers.TimeField()
+
+
+class AppointmentBatchSerializer(serializers.Serializer):
+    MAX_ITEMS = 50
+
+    doctor = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(role='doctor').select_related('profile')
+    )
+    appointments = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=MAX_ITEMS
+    )
+
+
+class SlotHoldSerializer(serializers.ModelSerializer):
+    doctor = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(role='doctor').select_related('profile')
+    )
+
+    class Meta:
+        model = SlotHold
+        fields = ['id', 'doctor', 'date', 'time', 'expires_at']
+        read_only_fields = ['id', 'expires_at']
+        # Uniqueness is handled by SlotHold.acquire, which may take over an expired hold
+        validators = []
+
+    def validate(self, data):
+        try:
+            doctor_profile = data['doctor'].profile
+        except User.profile.RelatedObjectDoesNotExist:
+            raise serializers.ValidationError("Doctor profile not found.")
+
+        validate_schedule(doctor_profile, data['date'], data['time'])
+        return data
+
+
+class AppointmentSeriesSerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    doctor = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(role='doctor').select_related('profile')
+    )
+    pet = serializers.PrimaryKeyRelatedField(queryset=Pet.objects.all(), allow_null=True)
+    interval = serializers.IntegerField(min_value=1, max_value=12, default=1)
+
+    class Meta:
+        model = AppointmentSeries
+        fields = [
+            'id', 'user', 'doctor', 'pet', 'title', 'reason', 'frequency', 'interval',
+            'start_date', 'end_date', 'time', 'status', 'materialized_until', 'created_at'
+        ]
+        read_only_fields = ['status', 'materialized_until', 'created_at']
+
+    def validate(self, data):
+        if data.get('end_date') and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError({"end_date": "end_date cannot be before start_date."})
+
+        try:
+            doctor_profile = data['doctor'].profile
+        except User.profile.RelatedObjectDoesNotExist:
+            raise serializers.ValidationError("Doctor profile not found.")
+
+        # The first visit must be bookable; later ones are checked as they are materialized
+        validate_schedule(doctor_profile, data['start_date'], data['time'])
+        return data
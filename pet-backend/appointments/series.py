@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from notifications.utils import create_notifications_bulk
+from .models import Appointment, DoctorDailyStats, SlotHold
+from .serializers import validate_schedule
+
+# How far ahead series occurrences exist as real Appointment rows
+SERIES_WINDOW_DAYS = 28
+
+
+def materialize_series(series, until=None):
+    """
+    Creates the series' Appointment rows up to `until` (default: today plus
+    SERIES_WINDOW_DAYS). Every new occurrence is checked against the doctor's
+    profile, loaded once, and against slots already taken, fetched with one
+    query, and slots held by other users; the rest are inserted with one
+    bulk_create and announced to the doctor with one coalesced notification.
+
+    Returns (created appointments, number of occurrences skipped). Raises
+    IntegrityError, with nothing written, when another booking takes one of
+    the slots between the check and the insert.
+    """
+    today = date.today()
+    until = until or today + timedelta(days=SERIES_WINDOW_DAYS)
+    start = today
+    if series.materialized_until and series.materialized_until >= today:
+        start = series.materialized_until + timedelta(days=1)
+
+    dates = series.occurrences_between(start, until)
+    doctor_profile = getattr(series.doctor, 'profile', None)
+    created, skipped = [], 0
+
+    with transaction.atomic():
+        if dates and doctor_profile is not None:
+            taken = set(Appointment.objects.filter(
+                doctor_id=series.doctor_id, date__in=dates, time=series.time
+            ).values_list('date', flat=True))
+            held = SlotHold.held_by_others(series.user, series.doctor_id, dates)
+
+            pending = []
+            for day in dates:
+                if day in taken or (day, series.time) in held:
+                    continue
+                try:
+                    validate_schedule(doctor_profile, day, series.time)
+                except ValidationError:
+                    continue
+                pending.append(Appointment(
+                    user=series.user,
+                    doctor=series.doctor,
+                    pet=series.pet,
+                    series=series,
+                    title=series.title,
+                    reason=series.reason,
+                    date=day,
+                    time=series.time,
+                ))
+
+            created = Appointment.objects.bulk_create(pending)
+            DoctorDailyStats.record_created(created)
+            if created:
+                create_notifications_bulk(
+                    recipient=series.doctor,
+                    verb="booked a recurring appointment",
+                    actor=series.user,
+                    items=[(appointment, appointment.booking_target()) for appointment in created]
+                )
+        skipped = len(dates) - len(created)
+
+        series.materialized_until = min(until, series.end_date) if series.end_date else until
+        series.save(update_fields=['materialized_until'])
+
+    if created:
+        doctor_profile.refresh_next_available()
+    return created, skipped
+
+
+def projected_appointments(series_list, today=None):
+    """
+    Unsaved Appointment instances for the next occurrence of each series past
+    its materialized window, so read endpoints can show what comes next
+    without expanding the whole recurrence. They have no id.
+    """
+    today = today or date.today()
+    projected = []
+    for series in series_list:
+        day = series.next_unmaterialized(today)
+        if day is None:
+            continue
+        projected.append(Appointment(
+            user=series.user,
+            doctor=series.doctor,
+            pet=series.pet,
+            series=series,
+            title=series.title,
+            reason=series.reason,
+            date=day,
+            time=series.time,
+        ))
+    projected.sort(key=lambda appointment: (appointment.date, appointment.time))
+    return projected
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from collections import Counter
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Appointment
+from .archive import archiving
+from .models import Appointment, DoctorDailyStats
 from notifications.utils import create_notification
+from doctor.models import DoctorProfile
 
 @receiver(post_save, sender=Appointment)
 def handle_appointment_notifications(sender, instance, created, **kwargs):
@@ -14,7 +17,8 @@ def handle_appointment_notifications(sender, instance, created, **kwargs):
             recipient=doctor,
             verb="booked an appointment",
             actor=user,
-            target=f"for {instance.pet.name if instance.pet else 'a pet'} on {instance.date} at {instance.time}"
+            target=instance.booking_target(),
+            appointment=instance
         )
 
     # Notify user if appointment status changes to accepted or rejected
@@ -23,5 +27,38 @@ def handle_appointment_notifications(sender, instance, created, **kwargs):
             recipient=user,
             verb=f"{instance.status} your appointment",
             actor=doctor,
-            target=f"on {instance.date} at {instance.time}"
+            target=f"on {instance.date} at {instance.time}",
+            appointment=instance
         )
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_doctor_next_available(sender, instance, **kwargs):
+    if archiving.get():
+        return
+    # Bookings, status changes, reschedules and deletions all move the doctor's
+    # next open slot; a reassignment moves both the old and the new doctor's
+    doctor_ids = {instance.doctor_id, getattr(instance, '_loaded_doctor_id', instance.doctor_id)}
+    for profile in DoctorProfile.objects.filter(doctor_id__in=doctor_ids):
+        profile.refresh_next_available()
+    instance._loaded_doctor_id = instance.doctor_id
+
+
+@receiver(post_save, sender=Appointment)
+def update_daily_stats_on_save(sender, instance, created, **kwargs):
+    new_key = instance.stats_key()
+    old_key = None if created else getattr(instance, '_stats_key', None)
+    if old_key != new_key:
+        deltas = Counter({new_key: 1})
+        if old_key:
+            deltas[old_key] -= 1
+        DoctorDailyStats.apply(deltas)
+    instance._stats_key = new_key
+
+
+@receiver(post_delete, sender=Appointment)
+def update_daily_stats_on_delete(sender, instance, **kwargs):
+    if archiving.get():
+        return
+    DoctorDailyStats.apply(Counter({getattr(instance, '_stats_key', instance.stats_key()): -1}))
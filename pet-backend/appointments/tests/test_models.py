@@ -0,0 +1,32 @@
+from datetime import date, time
+from django.test import SimpleTestCase
+from appointments.models import AppointmentSeries, add_months
+
+class AppointmentSeriesOccurrenceTests(SimpleTestCase):
+    def test_add_months_clamps_to_month_end(self):
+        self.assertEqual(add_months(date(2030, 1, 31), 1), date(2030, 2, 28))
+        self.assertEqual(add_months(date(2030, 11, 30), 3), date(2031, 2, 28))
+
+    def test_weekly_occurrences_start_inside_window(self):
+        series = AppointmentSeries(frequency='weekly', interval=2, start_date=date(2030, 1, 7), time=time(9, 0))
+        self.assertEqual(
+            series.occurrences_between(date(2030, 3, 1), date(2030, 3, 31)),
+            [date(2030, 3, 4), date(2030, 3, 18)]
+        )
+
+    def test_monthly_occurrences_respect_end_date(self):
+        series = AppointmentSeries(
+            frequency='monthly', interval=1, start_date=date(2030, 1, 31),
+            end_date=date(2030, 4, 15), time=time(9, 0)
+        )
+        self.assertEqual(
+            series.occurrences_between(date(2030, 1, 1), date(2030, 12, 31)),
+            [date(2030, 1, 31), date(2030, 2, 28), date(2030, 3, 31)]
+        )
+
+    def test_next_unmaterialized_skips_window(self):
+        series = AppointmentSeries(
+            frequency='weekly', interval=1, start_date=date(2030, 1, 7),
+            materialized_until=date(2030, 2, 3), time=time(9, 0)
+        )
+        self.assertEqual(series.next_unmaterialized(date(2030, 1, 10)), date(2030, 2, 4))
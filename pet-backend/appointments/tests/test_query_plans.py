@@ -0,0 +1,52 @@
+from datetime import date
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from appointments.models import Appointment
+from notifications.models import Notification
+
+User = get_user_model()
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class HotQueryPlanTests(TestCase):
+    """The hot dashboard and notification queries must keep using their composite or partial indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        cls.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"Expected one of {index_names} in query plan:\n{plan}"
+        )
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, f"Query plan sorts rows:\n{plan}")
+
+    def test_doctor_today(self):
+        queryset = Appointment.objects.filter(doctor=self.doctor, status='accepted', date=date.today()).order_by('time')
+        self.assertUsesIndex(queryset, 'appt_doctor_status_date_idx')
+
+    def test_doctor_requests(self):
+        queryset = Appointment.objects.filter(doctor=self.doctor, status='pending').order_by('date', 'time')
+        self.assertUsesIndex(queryset, 'appt_doctor_status_date_idx')
+
+    def test_user_upcoming(self):
+        queryset = Appointment.objects.filter(
+            user=self.user, status='accepted', date__gte=date.today()
+        ).order_by('date', 'time')
+        self.assertUsesIndex(queryset, 'appt_user_status_date_idx')
+
+    def test_notification_list(self):
+        queryset = Notification.objects.filter(recipient=self.user).order_by('-timestamp', '-id')
+        self.assertUsesIndex(queryset, 'notif_recipient_ts_idx')
+
+    def test_unread_notifications(self):
+        queryset = Notification.objects.filter(recipient=self.user, is_read=False).order_by('-timestamp')
+        self.assertUsesIndex(queryset, 'notif_unread_idx')
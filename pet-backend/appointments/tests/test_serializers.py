@@ -0,0 +1,82 @@
+from datetime import date, time, timedelta
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory
+from appointments.models import Appointment
+from appointments.serializers import AppointmentSerializer, AppointmentReadSerializer
+from doctor.models import DoctorProfile
+from pets.models import Pet
+
+User = get_user_model()
+
+def next_weekday(weekday):
+    today = date.today()
+    return today + timedelta(days=(weekday - today.weekday()) % 7 or 7)
+
+class AppointmentSerializerAvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday"],
+            available_times={"Monday": [{"from": "09:00", "to": "12:00"}]},
+            years_experience=4,
+            address="1 Main St"
+        )
+        request = APIRequestFactory().post('/api/appointments/')
+        request.user = self.user
+        self.context = {'request': request}
+
+    def build(self, appointment_date, appointment_time):
+        return AppointmentSerializer(data={
+            'doctor': str(self.doctor.id),
+            'pet': None,
+            'date': appointment_date.isoformat(),
+            'time': appointment_time.strftime('%H:%M'),
+        }, context=self.context)
+
+    def test_time_within_slot_is_valid(self):
+        serializer = self.build(next_weekday(0), time(10, 30))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_time_outside_slot_is_rejected(self):
+        serializer = self.build(next_weekday(0), time(13, 0))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("not within available slots", str(serializer.errors))
+
+    def test_unavailable_day_is_rejected(self):
+        serializer = self.build(next_weekday(1), time(10, 0))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("not available on Tuesday", str(serializer.errors))
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AppointmentReadSerializerTests(TestCase):
+    def test_matches_appointment_serializer_output(self):
+        user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        with_image = Pet.objects.create(owner=user, name="Bella", species="dog", age=2, image='pet_images/bella.jpg')
+        without_image = Pet.objects.create(owner=user, name="Milo", species="cat", age=4)
+        today = date.today()
+        for offset, pet in enumerate([with_image, without_image, None, with_image]):
+            Appointment.objects.create(
+                user=user, doctor=doctor, pet=pet, title="Checkup",
+                date=today + timedelta(days=offset), time=time(9 + offset, 30)
+            )
+
+        queryset = Appointment.objects.select_related('pet', 'user', 'doctor').order_by('date', 'time')
+        expected = AppointmentSerializer(queryset, many=True).data
+        rows = AppointmentReadSerializer.values(queryset)
+        self.assertEqual(AppointmentReadSerializer().serialize(rows), expected)
+        self.assertEqual(expected[0]['time'], "Today, 9:30 AM")
+        self.assertNotIn('petName', expected[2])
@@ -0,0 +1,621 @@
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from appointments.models import Appointment, AppointmentSeries, ArchivedAppointment, DoctorDailyStats, SlotHold
+from appointments.expiry import expire_batch
+from appointments.series import SERIES_WINDOW_DAYS
+from appointments.views import AppointmentViewSet
+from doctor.models import DoctorProfile
+from notifications.dispatch import dispatch_notifications
+from notifications.models import Notification
+from pets.models import Pet
+from utils.queries import QueryBudgetExceeded
+
+User = get_user_model()
+
+def next_weekday(weekday):
+    today = date.today()
+    return today + timedelta(days=(weekday - today.weekday()) % 7 or 7)
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AppointmentBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday"],
+            available_times={"Monday": [{"from": "09:00", "to": "12:00"}]},
+            years_experience=4,
+            address="1 Main St"
+        )
+        self.pet = Pet.objects.create(owner=self.user, name="Bella", species="dog", age=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.monday = next_weekday(0).isoformat()
+
+    def test_all_valid_items_are_created_with_one_notification_message(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(f"user_{self.doctor.id}", "doctor-channel")
+
+        response = self.client.post('/api/appointments/batch/', {
+            'doctor': str(self.doctor.id),
+            'appointments': [
+                {'pet': self.pet.id, 'date': self.monday, 'time': '09:00'},
+                {'pet': self.pet.id, 'date': self.monday, 'time': '10:00'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'created'])
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 2)
+        self.assertEqual(Notification.objects.filter(recipient=self.doctor).count(), 2)
+
+        # The coalesced message and the doctor's new unread count
+        self.assertEqual(dispatch_notifications(), 2)
+        message = async_to_sync(channel_layer.receive)("doctor-channel")
+        self.assertEqual(message['message']['count'], 2)
+
+    def test_invalid_items_are_reported_per_item(self):
+        Appointment.objects.create(user=self.user, doctor=self.doctor, date=self.monday, time='11:00')
+
+        response = self.client.post('/api/appointments/batch/', {
+            'doctor': str(self.doctor.id),
+            'appointments': [
+                {'date': self.monday, 'time': '09:30'},
+                {'date': self.monday, 'time': '11:00'},
+                {'date': self.monday, 'time': '15:00'},
+                {'date': self.monday, 'time': '09:30'},
+                {'date': 'not-a-date', 'time': '09:30'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'error', 'error', 'error', 'error']
+        )
+        self.assertIn('date', response.data['results'][4]['errors'])
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 2)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AppointmentQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        day = date.today() + timedelta(days=1)
+        for index in range(15):
+            owner = User.objects.create_user(
+                email=f"owner{index}@example.com", firstname="Pat", lastname=str(index), password="pass12345"
+            )
+            pet = Pet.objects.create(owner=owner, name=f"Pet {index}", species="cat", age=1)
+            Appointment.objects.create(user=owner, doctor=self.doctor, pet=pet, date=day, time=time(8, index))
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def test_list_actions_stay_within_budget(self):
+        response = self.client.get('/api/appointments/', {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 15)
+
+        response = self.client.get('/api/appointments/requests/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 15)
+
+    def test_list_pages_follow_date_time_id_order(self):
+        Appointment.objects.create(
+            user=self.doctor, doctor=self.doctor, date=date.today() + timedelta(days=2), time=time(7, 0)
+        )
+        expected = list(Appointment.objects.filter(doctor=self.doctor).order_by('date', 'time', 'id').values_list('id', flat=True))
+
+        ids, url = [], '/api/appointments/?page_size=4'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids += [appointment['id'] for appointment in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/appointments/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_exceeding_budget_fails_under_tests(self):
+        with mock.patch.object(AppointmentViewSet, 'query_budgets', {'requests': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/appointments/requests/')
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_exceeding_budget_only_logs_when_not_strict(self):
+        with mock.patch.object(AppointmentViewSet, 'query_budgets', {'requests': 0}):
+            with self.assertLogs('utils.queries', 'WARNING'):
+                self.assertEqual(self.client.get('/api/appointments/requests/').status_code, 200)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SlotHoldTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            email="alice@example.com", firstname="Alice", lastname="Owner", password="pass12345"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@example.com", firstname="Bob", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday"],
+            available_times={"Monday": [{"from": "09:00", "to": "12:00"}]},
+            years_experience=4,
+            address="1 Main St"
+        )
+        self.slot = {'doctor': str(self.doctor.id), 'date': next_weekday(0).isoformat(), 'time': '10:00'}
+        self.alice_client = APIClient()
+        self.alice_client.force_authenticate(self.alice)
+        self.bob_client = APIClient()
+        self.bob_client.force_authenticate(self.bob)
+
+    def test_held_slot_is_rejected_for_others_and_consumed_by_booking(self):
+        response = self.alice_client.post('/api/appointments/hold/', self.slot, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.bob_client.post('/api/appointments/hold/', self.slot, format='json').status_code, 409)
+        self.assertEqual(
+            self.bob_client.post('/api/appointments/', {**self.slot, 'pet': None}, format='json').status_code, 409
+        )
+
+        response = self.alice_client.post('/api/appointments/', {**self.slot, 'pet': None}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(SlotHold.objects.exists())
+
+        response = self.bob_client.post('/api/appointments/', {**self.slot, 'pet': None}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_batch_and_series_skip_slots_held_by_others(self):
+        self.assertEqual(self.alice_client.post('/api/appointments/hold/', self.slot, format='json').status_code, 201)
+
+        response = self.bob_client.post('/api/appointments/batch/', {
+            'doctor': self.slot['doctor'],
+            'appointments': [
+                {'date': self.slot['date'], 'time': '09:00'},
+                {'date': self.slot['date'], 'time': self.slot['time']},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual(response.data['results'][1]['errors']['non_field_errors'], ["This slot is being held by another user."])
+
+        response = self.bob_client.post('/api/appointment-series/', {
+            'doctor': self.slot['doctor'], 'pet': None, 'frequency': 'weekly',
+            'start_date': self.slot['date'], 'time': self.slot['time']
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        series = AppointmentSeries.objects.get()
+        self.assertTrue(series.appointments.exists())
+        self.assertFalse(series.appointments.filter(date=self.slot['date']).exists())
+
+    def test_expired_hold_can_be_taken_over_and_reaped(self):
+        self.alice_client.post('/api/appointments/hold/', self.slot, format='json')
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.bob_client.post('/api/appointments/hold/', self.slot, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(SlotHold.objects.get().user, self.bob)
+
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(SlotHold.reap_expired(), 1)
+        self.assertFalse(SlotHold.objects.exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AppointmentSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday"],
+            available_times={"Monday": [{"from": "09:00", "to": "12:00"}]},
+            years_experience=4,
+            address="1 Main St"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.monday = next_weekday(0)
+
+    def test_create_materializes_rolling_window_only(self):
+        Appointment.objects.create(
+            user=self.doctor, doctor=self.doctor, date=self.monday + timedelta(weeks=1), time=time(10, 0)
+        )
+        response = self.client.post('/api/appointment-series/', {
+            'doctor': str(self.doctor.id), 'pet': None, 'frequency': 'weekly',
+            'start_date': self.monday.isoformat(), 'time': '10:00'
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        series = AppointmentSeries.objects.get()
+        dates = list(series.appointments.values_list('date', flat=True))
+        expected = [
+            day for day in series.occurrences_between(date.today(), series.materialized_until)
+            if day != self.monday + timedelta(weeks=1)
+        ]
+        self.assertEqual(sorted(dates), expected)
+        self.assertTrue(all(day <= date.today() + timedelta(days=SERIES_WINDOW_DAYS) for day in dates))
+        self.assertEqual(Notification.objects.filter(verb="booked a recurring appointment").count(), len(dates))
+
+    def test_lost_race_on_an_occurrence_is_a_conflict(self):
+        with mock.patch('appointments.series.Appointment.objects.bulk_create', side_effect=IntegrityError):
+            response = self.client.post('/api/appointment-series/', {
+                'doctor': str(self.doctor.id), 'pet': None, 'frequency': 'weekly',
+                'start_date': self.monday.isoformat(), 'time': '10:00'
+            }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+    def test_upcoming_merges_next_projected_occurrence(self):
+        self.client.post('/api/appointment-series/', {
+            'doctor': str(self.doctor.id), 'pet': None, 'frequency': 'weekly',
+            'start_date': self.monday.isoformat(), 'time': '10:00'
+        }, format='json')
+        series = AppointmentSeries.objects.get()
+        series.appointments.update(status='accepted')
+
+        response = self.client.get('/api/appointments/upcoming/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), series.appointments.count() + 1)
+        projected = response.data[-1]
+        self.assertIsNone(projected['id'])
+        self.assertEqual(projected['series'], series.id)
+        self.assertEqual(projected['date'], series.next_unmaterialized(date.today()).isoformat())
+
+    def test_list_is_not_paginated(self):
+        self.client.post('/api/appointment-series/', {
+            'doctor': str(self.doctor.id), 'pet': None, 'frequency': 'weekly',
+            'start_date': self.monday.isoformat(), 'time': '10:00'
+        }, format='json')
+
+        response = self.client.get('/api/appointment-series/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([series['id'] for series in response.data], [AppointmentSeries.objects.get().id])
+
+    def test_cancel_drops_future_pending_occurrences(self):
+        self.client.post('/api/appointment-series/', {
+            'doctor': str(self.doctor.id), 'pet': None, 'frequency': 'weekly',
+            'start_date': self.monday.isoformat(), 'time': '10:00'
+        }, format='json')
+        series = AppointmentSeries.objects.get()
+
+        response = self.client.delete(f'/api/appointment-series/{series.id}/')
+        self.assertEqual(response.status_code, 204)
+        series.refresh_from_db()
+        self.assertEqual(series.status, 'cancelled')
+        self.assertFalse(series.appointments.exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        self.pet = Pet.objects.create(owner=self.user, name="Bella", species="dog", age=2)
+        self.appointment = Appointment.objects.create(
+            user=self.user, doctor=self.doctor, pet=self.pet, reason="Limping, left leg",
+            date=date.today() + timedelta(days=2), time=time(9, 30)
+        )
+        self.client = APIClient()
+
+    def feed_url(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/appointments/calendar-link/')
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 200)
+        return response.data['url']
+
+    def test_feed_streams_events_for_owner_and_doctor(self):
+        for user in (self.user, self.doctor):
+            response = self.client.get(self.feed_url(user))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+            body = b''.join(response.streaming_content).decode()
+            self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+            self.assertIn(f'UID:appointment-{self.appointment.id}@curapets\r\n', body)
+            self.assertIn(f"DTSTART:{self.appointment.date.strftime('%Y%m%d')}T093000\r\n", body)
+            self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+            self.assertIn('Reason: Limping\\, left leg', body.replace('\r\n ', ''))
+            self.assertIn('STATUS:TENTATIVE\r\n', body)
+
+    def test_unchanged_feed_answers_304_until_an_appointment_changes(self):
+        url = self.feed_url(self.user)
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(2):  # token owner + version aggregate
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.appointment.status = 'accepted'
+        self.appointment.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Deleting leaves no newer updated_at behind, the count still moves the ETag
+        etag = response['ETag']
+        Appointment.objects.create(user=self.user, doctor=self.doctor, date=date.today(), time=time(8, 0)).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.appointment.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_tampered_token_is_not_found(self):
+        url = self.feed_url(self.user).replace('.ics', 'x.ics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_reset_revokes_issued_links(self):
+        old_url = self.feed_url(self.user)
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/appointments/calendar-link/reset/')
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['url'], old_url)
+
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        self.assertEqual(self.client.get(response.data['url']).status_code, 200)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DoctorStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday"],
+            available_times={"Monday": [{"from": "09:00", "to": "12:00"}]},
+            years_experience=4,
+            address="1 Main St"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+        self.monday = next_weekday(0)
+
+    def stats(self, **params):
+        params.setdefault('from', self.monday.isoformat())
+        response = self.client.get('/api/appointments/stats/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_counts_follow_bookings_status_changes_and_deletions(self):
+        first = Appointment.objects.create(user=self.user, doctor=self.doctor, date=self.monday, time=time(9, 0))
+        second = Appointment.objects.create(user=self.user, doctor=self.doctor, date=self.monday, time=time(9, 30))
+        self.assertEqual(self.stats()['totals'], {'pending': 2, 'accepted': 0, 'rejected': 0, 'completed': 0, 'expired': 0})
+
+        response = self.client.patch(f'/api/appointments/{first.id}/', {'status': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        second.date = self.monday + timedelta(weeks=1)
+        second.save()
+        Appointment.objects.get(pk=second.pk).delete()
+
+        data = self.stats()
+        self.assertEqual(data['totals'], {'pending': 0, 'accepted': 1, 'rejected': 0, 'completed': 0, 'expired': 0})
+        self.assertEqual([day['date'] for day in data['days']], [self.monday])
+
+    def test_bulk_bookings_are_counted_and_rebuild_matches(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/appointments/batch/', {
+            'doctor': str(self.doctor.id),
+            'appointments': [
+                {'date': self.monday.isoformat(), 'time': '09:00'},
+                {'date': (self.monday + timedelta(weeks=1)).isoformat(), 'time': '10:00'},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.doctor)
+
+        with self.assertNumQueries(1):
+            data = self.stats()
+        self.assertEqual(data['totals']['pending'], 2)
+        self.assertEqual(len(data['days']), 2)
+
+        call_command('rebuild_appointment_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), data)
+
+    def test_uncounted_rows_do_not_break_later_status_changes(self):
+        # bulk_create without record_created leaves the stats undercounting
+        uncounted, = Appointment.objects.bulk_create([
+            Appointment(user=self.user, doctor=self.doctor, date=self.monday, time=time(9, 0))
+        ])
+        counted = Appointment.objects.create(user=self.user, doctor=self.doctor, date=self.monday, time=time(9, 30))
+        Appointment.objects.get(pk=uncounted.pk).delete()
+
+        response = self.client.patch(f'/api/appointments/{counted.id}/', {'status': 'accepted'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.stats()['totals'], {'pending': 0, 'accepted': 1, 'rejected': 0, 'completed': 0, 'expired': 0})
+
+    def test_only_doctors_and_valid_ranges(self):
+        self.assertEqual(self.client.get('/api/appointments/stats/', {'from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/appointments/stats/', {
+            'from': '2030-01-02', 'to': '2030-01-01'
+        }).status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/appointments/stats/').status_code, 403)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AppointmentArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        self.pet = Pet.objects.create(owner=self.user, name="Bella", species="dog", age=2)
+        long_ago = date.today() - timedelta(days=400)
+        self.old = [
+            Appointment.objects.create(
+                user=self.user, doctor=self.doctor, pet=self.pet, date=long_ago + timedelta(days=index),
+                time=time(9, 0), status=status
+            )
+            for index, status in enumerate(['completed', 'rejected', 'completed'])
+        ]
+        self.old_pending = Appointment.objects.create(
+            user=self.user, doctor=self.doctor, date=long_ago, time=time(10, 0)
+        )
+        self.recent = Appointment.objects.create(
+            user=self.user, doctor=self.doctor, date=date.today() - timedelta(days=3), time=time(9, 0), status='completed'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_moves_old_terminal_rows_in_batches(self):
+        booked = Notification.objects.create(
+            recipient=self.doctor, actor=self.user, verb="booked an appointment", appointment=self.old[0]
+        )
+        stats = list(DoctorDailyStats.objects.order_by('date').values())
+
+        out = StringIO()
+        call_command('archive_appointments', '--older-than', '365', '--batch-size', '2', stdout=out)
+        self.assertIn("Archived 3 appointments.", out.getvalue())
+
+        self.assertEqual(
+            set(ArchivedAppointment.objects.values_list('id', flat=True)), {a.id for a in self.old}
+        )
+        self.assertEqual(
+            set(Appointment.objects.values_list('id', flat=True)), {self.old_pending.id, self.recent.id}
+        )
+        booked.refresh_from_db()
+        self.assertIsNone(booked.appointment)
+        self.assertEqual(booked.archived_appointment.pet, self.pet)
+        self.assertEqual(list(DoctorDailyStats.objects.order_by('date').values()), stats)
+
+        # Nothing left to move: a rerun is a no-op
+        call_command('archive_appointments', '--older-than', '365', stdout=StringIO())
+        self.assertEqual(ArchivedAppointment.objects.count(), 3)
+
+    def test_history_lists_archive_only_on_request(self):
+        call_command('archive_appointments', '--older-than', '365', stdout=StringIO())
+
+        response = self.client.get('/api/appointments/', {'page_size': 100})
+        self.assertEqual({a['id'] for a in response.data['results']}, {self.old_pending.id, self.recent.id})
+
+        response = self.client.get('/api/appointments/history/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a['id'] for a in response.data['results']], [self.old[2].id, self.old[1].id])
+        self.assertEqual(response.data['results'][0]['petName'], "Bella")
+        response = self.client.get(response.data['next'])
+        self.assertEqual([a['id'] for a in response.data['results']], [self.old[0].id])
+        self.assertIsNone(response.data['next'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PendingExpiryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        self.yesterday = date.today() - timedelta(days=1)
+        self.stale = [
+            Appointment.objects.create(user=self.user, doctor=self.doctor, date=self.yesterday, time=time(9, minute))
+            for minute in range(0, 50, 10)
+        ]
+        self.answered = Appointment.objects.create(
+            user=self.user, doctor=self.doctor, date=self.yesterday, time=time(11, 0), status='accepted'
+        )
+        self.upcoming = Appointment.objects.create(
+            user=self.user, doctor=self.doctor, date=date.today() + timedelta(days=1), time=time(9, 0)
+        )
+
+    def test_rows_answered_after_selection_are_left_alone(self):
+        # The answered row stands in for one the doctor accepts between the SELECT and the UPDATE
+        queryset = Appointment.objects.filter(pk__in=[self.stale[0].pk, self.answered.pk])
+        self.assertEqual(expire_batch(queryset), 1)
+
+        self.assertEqual(Appointment.objects.get(pk=self.answered.pk).status, 'accepted')
+        stats = DoctorDailyStats.objects.get(doctor=self.doctor, date=self.yesterday)
+        self.assertEqual((stats.pending, stats.accepted, stats.expired), (4, 1, 1))
+        self.assertEqual(
+            list(Notification.objects.filter(verb="did not respond to your appointment request").values_list('count', flat=True)),
+            [1]
+        )
+
+    def test_expires_past_pending_rows_in_chunks_without_post_save(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(f"user_{self.user.id}", "owner-channel")
+
+        saved = []
+        def record_save(sender, instance, **kwargs):
+            saved.append(instance.pk)
+        post_save.connect(record_save, sender=Appointment)
+        try:
+            call_command('expire_pending_appointments', '--batch-size', '2', stdout=StringIO())
+        finally:
+            post_save.disconnect(record_save, sender=Appointment)
+        self.assertEqual(saved, [])
+
+        self.assertEqual(
+            set(Appointment.objects.filter(status='expired').values_list('id', flat=True)),
+            {appointment.id for appointment in self.stale}
+        )
+        self.assertEqual(Appointment.objects.get(pk=self.upcoming.pk).status, 'pending')
+        self.assertEqual(Appointment.objects.get(pk=self.answered.pk).status, 'accepted')
+
+        stats = DoctorDailyStats.objects.get(doctor=self.doctor, date=self.yesterday)
+        self.assertEqual((stats.pending, stats.accepted, stats.expired), (0, 1, 5))
+
+        expired_notifications = Notification.objects.filter(
+            recipient=self.user, verb="did not respond to your appointment request"
+        )
+        self.assertEqual(expired_notifications.count(), 5)
+        # One message per batch of two, two and one
+        dispatch_notifications()
+        messages = []
+        while True:
+            message = async_to_sync(channel_layer.receive)("owner-channel")
+            messages.append(message['message']['count'])
+            if sum(messages) == 5:
+                break
+        self.assertEqual(messages, [2, 2, 1])
+
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        response = client.get('/api/appointments/requests/')
+        self.assertEqual([a['id'] for a in response.data], [self.upcoming.id])
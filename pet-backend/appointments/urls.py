@@ -1,7 +1,11 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import AppointmentViewSet
+from .views import AppointmentViewSet, AppointmentSeriesViewSet, calendar_feed
 
 router = DefaultRouter()
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
+router.register(r'appointment-series', AppointmentSeriesViewSet, basename='appointment-series')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('appointments/calendar/<str:token>.ics', calendar_feed, name='appointment-calendar-feed'),
+] + router.urls
@@ -1,17 +1,72 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
-from .models import Appointment
-from .serializers import AppointmentSerializer
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from .models import Appointment, AppointmentSeries, ArchivedAppointment, DoctorDailyStats, SlotHold
+from .series import materialize_series, projected_appointments
+from .calendar import calendar_token, calendar_user, feed_queryset, feed_version, iter_calendar, rotate_calendar_secret
+from .serializers import (
+    AppointmentSerializer,
+    AppointmentReadSerializer,
+    AppointmentSeriesSerializer,
+    AppointmentBatchSerializer,
+    AppointmentBatchItemSerializer,
+    SlotHoldSerializer,
+    validate_schedule,
+)
+from pets.models import Pet
+from notifications.utils import create_notifications_bulk
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
-from datetime import date
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
+from datetime import date, timedelta
+import heapq
 from utils.auth import get_safe_user
+from utils.pagination import KeysetPagination
+from utils.queries import QueryBudgetMixin
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+STATS_DEFAULT_DAYS = 30
+STATS_MAX_DAYS = 366
+
+def requested_slot(data):
+    """
+    Cheaply reads (doctor id, date, time) from raw request data so slot
+    conflicts can be answered before full validation. Returns None if any
+    part is missing or malformed; validation then reports it properly.
+    """
+    try:
+        return (
+            data['doctor'],
+            serializers.DateField().to_internal_value(data['date']),
+            serializers.TimeField().to_internal_value(data['time']),
+        )
+    except (KeyError, TypeError, ValidationError):
+        return None
+
+def slot_taken_response(detail):
+    return Response({"detail": detail}, status=status.HTTP_409_CONFLICT)
+
+def batch_error(index, errors):
+    return {"index": index, "status": "error", "errors": errors}
+
+class AppointmentViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    # AppointmentSerializer reads pet.name/image, user names and doctor.firstname
+    select_related_fields = ('pet', 'user', 'doctor')
+    query_budgets = {'list': 3, 'retrieve': 3, 'upcoming': 4, 'today': 3, 'requests': 3, 'stats': 2, 'history': 2}
+
+    def get_keyset_ordering(self):
+        if self.action == 'history':
+            return ('-date', '-time', '-id')
+        return ('date', 'time', 'id')
 
     def get_queryset(self):
         user = get_safe_user(self)
@@ -22,8 +77,32 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Appointment.objects.filter(doctor=user)
         return Appointment.objects.filter(user=user)
 
+    def create(self, request, *args, **kwargs):
+        slot = requested_slot(request.data)
+        if slot:
+            try:
+                if slot[1:] in SlotHold.held_by_others(request.user, slot[0], [slot[1]]):
+                    return slot_taken_response("This slot is being held by another user.")
+                if Appointment.objects.filter(doctor_id=slot[0], date=slot[1], time=slot[2]).exists():
+                    return slot_taken_response("This slot is already booked.")
+            except (ValueError, DjangoValidationError):
+                pass  # malformed doctor id, let the serializer report it
+
+        try:
+            return super().create(request, *args, **kwargs)
+        except IntegrityError:
+            return slot_taken_response("This slot is already booked.")
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            appointment = serializer.save(user=self.request.user)
+            # Booking consumes the user's hold on the slot, if any
+            SlotHold.objects.filter(
+                user=self.request.user,
+                doctor=appointment.doctor,
+                date=appointment.date,
+                time=appointment.time
+            ).delete()
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -36,6 +115,11 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         return super().update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        # Keeps the daily stats change in the same transaction as the appointment's
+        with transaction.atomic():
+            serializer.save()
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
 
@@ -47,9 +131,16 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
     @action(detail=False, methods=['get'], url_path='upcoming')
     def upcoming(self, request):
-        """Get upcoming accepted appointments for the user."""
+        """
+        Get upcoming accepted appointments for the user, merged with the next
+        not-yet-materialized occurrence of each active recurring series (id null).
+        """
         user = request.user
         today = date.today()
         queryset = Appointment.objects.filter(
@@ -57,8 +148,13 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             status='accepted',
             date__gte=today
         ).order_by('date', 'time')
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        series = AppointmentSeries.objects.filter(user=user, status='active').select_related('pet', 'user', 'doctor')
+        rows = heapq.merge(
+            AppointmentReadSerializer.values(queryset),
+            map(AppointmentReadSerializer.row_from_instance, projected_appointments(series, today)),
+            key=AppointmentReadSerializer.SORT_KEY
+        )
+        return Response(AppointmentReadSerializer().serialize(rows))
 
     @action(detail=False, methods=['get'], url_path='today')
     def today(self, request):
@@ -72,8 +168,8 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             status='accepted',
             date=today
         ).order_by('time')
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        rows = AppointmentReadSerializer.values(queryset)
+        return Response(AppointmentReadSerializer().serialize(rows))
 
     @action(detail=False, methods=['get'], url_path='requests')
     def requests(self, request):
@@ -85,5 +181,255 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             doctor=user,
             status='pending'
         ).order_by('date', 'time')
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        rows = AppointmentReadSerializer.values(queryset)
+        return Response(AppointmentReadSerializer().serialize(rows))
+
+    @action(detail=False, methods=['get'], url_path='history')
+    def history(self, request):
+        """
+        Archived (old completed or rejected) appointments, newest first. Every
+        other action reads only live appointments.
+        """
+        user = request.user
+        if user.role == 'doctor':
+            queryset = ArchivedAppointment.objects.filter(doctor=user)
+        else:
+            queryset = ArchivedAppointment.objects.filter(user=user)
+        page = self.paginate_queryset(queryset.select_related('pet', 'user', 'doctor'))
+        rows = map(AppointmentReadSerializer.row_from_instance, page)
+        return self.get_paginated_response(AppointmentReadSerializer().serialize(rows))
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def stats(self, request):
+        """
+        Appointment counts by status for the doctor, per day between ?from= and
+        ?to= (YYYY-MM-DD, default the STATS_DEFAULT_DAYS days from today) and in
+        total. Reads the precomputed DoctorDailyStats rows only.
+        """
+        user = request.user
+        if user.role != 'doctor':
+            raise PermissionDenied("Only doctors can view appointment stats.")
+        try:
+            start = date.fromisoformat(request.query_params.get('from', date.today().isoformat()))
+            end = date.fromisoformat(
+                request.query_params.get('to', (start + timedelta(days=STATS_DEFAULT_DAYS - 1)).isoformat())
+            )
+        except ValueError:
+            return Response(
+                {"detail": "'from' and 'to' must be YYYY-MM-DD dates."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end < start:
+            return Response({"detail": "'to' must not be before 'from'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= STATS_MAX_DAYS:
+            return Response(
+                {"detail": f"Date range cannot exceed {STATS_MAX_DAYS} days."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        statuses = DoctorDailyStats.STATUSES
+        rows = DoctorDailyStats.objects.filter(
+            doctor=user, date__range=(start, end)
+        ).order_by('date').values('date', *statuses)
+
+        totals = dict.fromkeys(statuses, 0)
+        days = []
+        for row in rows:
+            if not any(row[name] for name in statuses):
+                continue
+            for name in statuses:
+                totals[name] += row[name]
+            days.append(row)
+        return Response({"from": start, "to": end, "totals": totals, "days": days})
+
+    @action(detail=False, methods=['get'], url_path='calendar-link')
+    def calendar_link(self, request):
+        """Subscription URL of the user's iCalendar feed."""
+        path = reverse('appointment-calendar-feed', args=[calendar_token(request.user)])
+        return Response({"url": request.build_absolute_uri(path)})
+
+    @action(detail=False, methods=['post'], url_path='calendar-link/reset')
+    def reset_calendar_link(self, request):
+        """Revoke every calendar subscription URL issued so far and return a new one."""
+        rotate_calendar_secret(request.user)
+        return self.calendar_link(request)
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Book several appointments with one doctor at once. Every item is
+        validated against the same doctor profile, the valid ones are inserted
+        in one transaction and the doctor gets one coalesced notification.
+        """
+        batch = AppointmentBatchSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+        doctor = batch.validated_data['doctor']
+        items = batch.validated_data['appointments']
+
+        doctor_profile = getattr(doctor, 'profile', None)
+        if doctor_profile is None:
+            return Response({"detail": "Doctor profile not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            item_serializer = AppointmentBatchItemSerializer(data=item)
+            if not item_serializer.is_valid():
+                results[index] = batch_error(index, item_serializer.errors)
+                continue
+            data = item_serializer.validated_data
+            try:
+                validate_schedule(doctor_profile, data['date'], data['time'])
+            except ValidationError as e:
+                results[index] = batch_error(index, {"non_field_errors": e.detail})
+                continue
+            valid.append((index, data))
+
+        pets = Pet.objects.in_bulk({data['pet'] for _, data in valid if data.get('pet')})
+        dates = {data['date'] for _, data in valid}
+        taken = set(Appointment.objects.filter(doctor=doctor, date__in=dates).values_list('date', 'time'))
+        held = SlotHold.held_by_others(request.user, doctor.pk, dates)
+
+        pending = []
+        for index, data in valid:
+            pet_id = data.get('pet')
+            if pet_id and pet_id not in pets:
+                results[index] = batch_error(index, {"pet": ["Pet not found."]})
+                continue
+            slot = (data['date'], data['time'])
+            if slot in taken:
+                results[index] = batch_error(index, {"non_field_errors": ["This slot is already booked."]})
+                continue
+            if slot in held:
+                results[index] = batch_error(index, {"non_field_errors": ["This slot is being held by another user."]})
+                continue
+            taken.add(slot)
+            pending.append((index, Appointment(
+                user=request.user,
+                doctor=doctor,
+                pet=pets.get(pet_id),
+                title=data.get('title', ''),
+                reason=data.get('reason', ''),
+                date=data['date'],
+                time=data['time'],
+            )))
+
+        if pending:
+            try:
+                with transaction.atomic():
+                    created = Appointment.objects.bulk_create([appointment for _, appointment in pending])
+                    DoctorDailyStats.record_created(created)
+                    create_notifications_bulk(
+                        recipient=doctor,
+                        verb="booked an appointment",
+                        actor=request.user,
+                        items=[(appointment, appointment.booking_target()) for appointment in created]
+                    )
+            except IntegrityError:
+                return Response(
+                    {"detail": "One or more slots were booked by someone else. Please retry."},
+                    status=status.HTTP_409_CONFLICT
+                )
+            doctor_profile.refresh_next_available()
+            for (index, _), appointment in zip(pending, created):
+                results[index] = {
+                    "index": index,
+                    "status": "created",
+                    "appointment": self.get_serializer(appointment).data,
+                }
+
+        if not pending:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(pending) < len(items):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({"results": results}, status=response_status)
+
+    @action(detail=False, methods=['post'], url_path='hold')
+    def hold(self, request):
+        """
+        Hold a (doctor, date, time) slot for a few minutes before booking it.
+        Returns 409 straight away when the slot is booked or held by someone else.
+        """
+        serializer = SlotHoldSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        doctor = serializer.validated_data['doctor']
+        slot_date = serializer.validated_data['date']
+        slot_time = serializer.validated_data['time']
+
+        if Appointment.objects.filter(doctor=doctor, date=slot_date, time=slot_time).exists():
+            return slot_taken_response("This slot is already booked.")
+
+        hold = SlotHold.acquire(request.user, doctor, slot_date, slot_time)
+        if hold is None:
+            return slot_taken_response("This slot is being held by another user.")
+        return Response(SlotHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+
+@require_GET
+def calendar_feed(request, token):
+    """
+    iCalendar feed of a user's appointments, addressed by a signed token so
+    calendar apps can subscribe without a JWT. The ETag and Last-Modified come
+    from one aggregate query, so an unchanged calendar is answered with a 304
+    before any appointment row is read.
+    """
+    user = calendar_user(token)
+    if user is None:
+        raise Http404
+
+    queryset = feed_queryset(user)
+    etag, last_modified = feed_version(user, queryset)
+    etag = quote_etag(etag)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+    name = f"Curapets - {user.firstname} {user.lastname}"
+    response = StreamingHttpResponse(iter_calendar(queryset, name, stamp), content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class AppointmentSeriesViewSet(viewsets.ModelViewSet):
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+    keyset_ordering = ('created_at', 'id')
+
+    def get_queryset(self):
+        user = get_safe_user(self)
+        if not user:
+            return AppointmentSeries.objects.none()
+
+        if user.role == 'doctor':
+            return AppointmentSeries.objects.filter(doctor=user)
+        return AppointmentSeries.objects.filter(user=user)
+
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except IntegrityError:
+            return slot_taken_response("One or more occurrences were booked by someone else. Please retry.")
+
+    def perform_create(self, serializer):
+        # A lost race on an occurrence drops the series too, so the client can retry cleanly
+        with transaction.atomic():
+            series = serializer.save(user=self.request.user)
+            materialize_series(series)
+
+    def destroy(self, request, *args, **kwargs):
+        """Cancel the series and drop its future occurrences that are still pending."""
+        series = self.get_object()
+        with transaction.atomic():
+            series.status = 'cancelled'
+            series.save(update_fields=['status'])
+            series.appointments.filter(status='pending', date__gte=date.today()).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,10 +1,16 @@
 
 from django.contrib import admin
-from .models import DoctorProfile, DoctorApplication, Certificate
+from .models import DoctorProfile, DoctorApplication, Certificate, MediaDeletion
 from .admin_forms import DoctorProfileAdminForm
 
 admin.site.register(DoctorApplication)
 admin.site.register(Certificate)
+
+@admin.register(MediaDeletion)
+class MediaDeletionAdmin(admin.ModelAdmin):
+    list_display = ['public_id', 'attempts', 'next_attempt_at', 'created_at']
+    readonly_fields = ['created_at']
+
 @admin.register(DoctorProfile)
 class DoctorProfileAdmin(admin.ModelAdmin):
     form = DoctorProfileAdminForm
@@ -5,5 +5,5 @@ class DoctorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "doctor"
 
-def ready(self):
-    import doctor.signals
\ No newline at end of file
+    def ready(self):
+        import doctor.signals
\ No newline at end of file
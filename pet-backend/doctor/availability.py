@@ -0,0 +1,152 @@
+import bisect
+import re
+from datetime import timedelta
+
+# Slot length used for free-slot listings and the directory's next-available sort
+DEFAULT_SLOT_MINUTES = 30
+# How far ahead next_available_at and open_slots_count look
+AVAILABILITY_WINDOW_DAYS = 14
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+_HHMM = re.compile(r'^(\d{1,2}):(\d{1,2})$')
+
+
+def parse_hhmm(value):
+    """
+    Converts an 'HH:MM' string into minutes since midnight.
+    Raises ValueError for anything that is not a valid time of day.
+    """
+    match = _HHMM.match(value) if isinstance(value, str) else None
+    if not match:
+        raise ValueError(f"Invalid time '{value}', expected 'HH:MM'.")
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Invalid time '{value}', expected 'HH:MM'.")
+    return hours * 60 + minutes
+
+
+def to_minutes(value):
+    """Minutes since midnight for a datetime.time."""
+    return value.hour * 60 + value.minute
+
+
+def compile_day(time_slots):
+    """
+    Compiles a list of {"from", "to"} dicts into a list of [start, end] minute
+    pairs sorted by start. Raises ValueError on malformed slots.
+    """
+    if not isinstance(time_slots, list):
+        raise ValueError("Time slots must be a list.")
+    intervals = []
+    for slot in time_slots:
+        if not isinstance(slot, dict) or 'from' not in slot or 'to' not in slot:
+            raise ValueError(f"Invalid time slot format: {slot}")
+        intervals.append([parse_hhmm(slot['from']), parse_hhmm(slot['to'])])
+    intervals.sort()
+    return intervals
+
+
+def compile_available_times(available_times):
+    """
+    Compiles DoctorProfile.available_times into the stored availability index:
+    {"Monday": [[540, 720], [780, 1020]], ...} with minutes since midnight.
+    Overlapping or touching slots are merged so each day is a disjoint list.
+    """
+    if not isinstance(available_times, dict):
+        raise ValueError("available_times must be a dictionary with days as keys.")
+    return {day: merge_intervals(compile_day(slots)) for day, slots in available_times.items()}
+
+
+def merge_intervals(intervals):
+    """Merges sorted [start, end] pairs that overlap or touch."""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def find_overlap(intervals):
+    """Returns the first pair of overlapping intervals, or None."""
+    for prev, curr in zip(intervals, intervals[1:]):
+        if curr[0] < prev[1]:
+            return prev, curr
+    return None
+
+
+def covers(intervals, minute):
+    """
+    True when minute falls within one of the sorted intervals (bounds inclusive).
+    Binary search on the interval starts, so a lookup is O(log n).
+    """
+    position = bisect.bisect_right(intervals, [minute, float('inf')])
+    if position == 0:
+        return False
+    return minute <= intervals[position - 1][1]
+
+
+def format_minutes(minute):
+    """Renders minutes since midnight as 'HH:MM'."""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def subtract_intervals(intervals, busy):
+    """
+    Subtracts sorted, disjoint busy intervals from sorted, disjoint intervals
+    in a single sweep over both lists.
+    """
+    free = []
+    j = 0
+    for start, end in intervals:
+        cursor = start
+        while j < len(busy) and busy[j][1] <= cursor:
+            j += 1
+        k = j
+        while k < len(busy) and busy[k][0] < end:
+            if busy[k][0] > cursor:
+                free.append([cursor, busy[k][0]])
+            cursor = max(cursor, busy[k][1])
+            k += 1
+        if cursor < end:
+            free.append([cursor, end])
+    return free
+
+
+def round_up(minute, granularity):
+    """The first multiple of granularity at or after minute."""
+    return -(-minute // granularity) * granularity
+
+
+def free_slots(index, start_date, end_date, booked, granularity, now=None):
+    """
+    Expands a compiled availability index over [start_date, end_date] and
+    subtracts booked appointments, each holding `granularity` minutes.
+
+    booked maps a date to the minutes already taken on it. Slots start on
+    the granularity grid counted from midnight, so a booking at an odd time
+    does not shift the slots after it; with now (a local datetime), no slot
+    starts before it. Returns a list of (date, [slot start minutes]) for
+    every date that still has an open slot.
+    """
+    result = []
+    day = start_date
+    while day <= end_date:
+        intervals = index.get(DAY_NAMES[day.weekday()], [])
+        if now is not None and day <= now.date():
+            # The minute now falls in has begun, so the earliest start is the next one
+            earliest = to_minutes(now) + bool(now.second or now.microsecond) if day == now.date() else 24 * 60
+            intervals = [[max(start, earliest), end] for start, end in intervals if end > earliest]
+        if intervals:
+            busy = merge_intervals(sorted([m, m + granularity] for m in booked.get(day, ())))
+            starts = [
+                minute
+                for start, end in subtract_intervals(intervals, busy)
+                for minute in range(round_up(start, granularity), end - granularity + 1, granularity)
+            ]
+            if starts:
+                result.append((day, starts))
+        day += timedelta(days=1)
+    return result
@@ -0,0 +1,73 @@
+import hashlib
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+# Cached directory responses live this long; versions make them stale sooner
+DIRECTORY_CACHE_TIMEOUT = 60 * 15
+
+_DIRECTORY_VERSION_KEY = 'doctor-directory:version'
+_PROFILE_VERSION_KEY = 'doctor-directory:profile:{}:version'
+
+
+def _new_version():
+    # Nanosecond timestamps: unique and ordered
+    return str(time.time_ns())
+
+
+def directory_version():
+    """Changes whenever any profile shown in the directory changes."""
+    return cache.get_or_set(_DIRECTORY_VERSION_KEY, _new_version, None)
+
+
+def profile_version(pk):
+    """Changes whenever the profile or its doctor's user fields change."""
+    return cache.get_or_set(_PROFILE_VERSION_KEY.format(pk), _new_version, None)
+
+
+def invalidate_profile(pk):
+    """
+    Gives the profile and the directory new versions, so every cached list
+    page and the profile's own cached detail stop matching at once.
+
+    The bump waits for the surrounding transaction to commit: bumped any
+    earlier, a concurrent request could cache the old rows under the new
+    version, and a rollback would only have flushed the cache.
+    """
+    def bump():
+        version = _new_version()
+        cache.set_many({_DIRECTORY_VERSION_KEY: version, _PROFILE_VERSION_KEY.format(pk): version}, None)
+    transaction.on_commit(bump)
+
+
+def cached_response(request, version, compute):
+    """
+    Serves a public, non-personalized GET from the shared cache under an
+    ETag built from version and the full URL. A matching If-None-Match gets
+    a 304 without a database query; otherwise the cached data is reused, and
+    compute() runs only on a miss.
+
+    There is no Last-Modified: whole seconds cannot tell apart two edits in
+    the same second, so If-Modified-Since would answer a false 304.
+    """
+    url = request.build_absolute_uri()
+    etag = quote_etag(hashlib.md5(f"{version}:{url}".encode()).hexdigest())
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = f"doctor-directory:response:{etag}"
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = compute()
+            if response.status_code != 200:
+                return response  # errors are neither cached nor validated
+            cache.set(key, response.data, DIRECTORY_CACHE_TIMEOUT)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, no-cache'
+    return response
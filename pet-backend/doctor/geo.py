@@ -0,0 +1,97 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+# Grid cells are CELL_DEGREES on a side, numbered row by row from (-90, -180)
+CELL_DEGREES = 0.25
+GRID_COLUMNS = int(360 / CELL_DEGREES)
+GRID_ROWS = int(180 / CELL_DEGREES)
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+
+
+def parse_point(value):
+    """
+    Parses 'lat,lng' into a (lat, lng) pair of floats.
+    Raises ValueError for anything that is not a valid coordinate.
+    """
+    parts = value.split(',') if isinstance(value, str) else []
+    if len(parts) != 2:
+        raise ValueError(f"Invalid point '{value}', expected 'lat,lng'.")
+    lat, lng = float(parts[0]), float(parts[1])
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"Invalid point '{value}', expected 'lat,lng'.")
+    return lat, lng
+
+
+def _row(lat):
+    return min(int((lat + 90) // CELL_DEGREES), GRID_ROWS - 1)
+
+
+def _column(lng):
+    return int((lng + 180) // CELL_DEGREES) % GRID_COLUMNS
+
+
+def cell_for(lat, lng):
+    """Grid cell number of a point."""
+    return _row(lat) * GRID_COLUMNS + _column(lng)
+
+
+def cell_ranges(lat, lng, radius_km):
+    """
+    Covers the circle of radius_km around (lat, lng) with grid cells,
+    returned as inclusive (first, last) cell number ranges. Cells in a row
+    are numbered consecutively, so each row of the bounding box is a single
+    range scan on the cell index (two where it crosses the antimeridian).
+    """
+    lat_span = radius_km / KM_PER_DEGREE
+    south, north = max(lat - lat_span, -90), min(lat + lat_span, 90)
+    # Longitude degrees shrink towards the poles; use the widest latitude in the box
+    widest = max(abs(south), abs(north))
+    cos_lat = math.cos(math.radians(min(widest, 89.9)))
+    lng_span = radius_km / (KM_PER_DEGREE * cos_lat)
+
+    if lng_span >= 180:
+        column_spans = [(0, GRID_COLUMNS - 1)]
+    else:
+        first, last = _column(lng - lng_span), _column(lng + lng_span)
+        if first <= last:
+            column_spans = [(first, last)]
+        else:
+            column_spans = [(first, GRID_COLUMNS - 1), (0, last)]
+
+    return [
+        (row * GRID_COLUMNS + first, row * GRID_COLUMNS + last)
+        for row in range(_row(south), _row(north) + 1)
+        for first, last in column_spans
+    ]
+
+
+def nearest(candidates, lat, lng, radius_km):
+    """
+    Exact great-circle distances from (lat, lng) to candidate (id, lat, lng)
+    rows. Returns [(distance_km, id)] within radius_km, nearest first.
+
+    Trigonometry for the origin is computed once, and a cheap latitude check
+    drops far candidates before the haversine formula runs.
+    """
+    lat_span = radius_km / KM_PER_DEGREE
+    origin_lat = math.radians(lat)
+    origin_lng = math.radians(lng)
+    origin_cos = math.cos(origin_lat)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+
+    found = []
+    for pk, other_lat, other_lng in candidates:
+        if abs(other_lat - lat) > lat_span:
+            continue
+        phi = radians(other_lat)
+        half_dlat = (phi - origin_lat) / 2
+        half_dlng = (radians(other_lng) - origin_lng) / 2
+        a = sin(half_dlat) ** 2 + origin_cos * cos(phi) * sin(half_dlng) ** 2
+        distance = 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+        if distance <= radius_km:
+            found.append((distance, pk))
+    found.sort()
+    return found
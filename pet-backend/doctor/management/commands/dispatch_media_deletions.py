@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from doctor.media import DELETE_BATCH_SIZE, dispatch_deletions
+
+class Command(BaseCommand):
+    help = 'Delete queued media files (the MediaDeletion outbox) through the media API in bulk batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE, help='Files deleted per API call')
+        parser.add_argument('--watch', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --watch')
+
+    def handle(self, *args, **options):
+        if not options['watch']:
+            deleted = dispatch_deletions(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} media files."))
+            return
+
+        self.stdout.write(f"Dispatching media deletions every {options['interval']}s.")
+        while True:
+            deleted = dispatch_deletions(options['batch_size'])
+            if deleted:
+                self.stdout.write(f"Deleted {deleted} media files.")
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from doctor.models import DoctorProfile
+
+class Command(BaseCommand):
+    help = 'Rebuild the AvailabilityWindow table from every profile\'s available_days and available_times'
+
+    def handle(self, *args, **kwargs):
+        # Profile saves keep the table current; this backfills profiles saved before it existed
+        count = 0
+        for profile in DoctorProfile.objects.iterator(chunk_size=500):
+            with transaction.atomic():
+                profile.rebuild_availability_windows()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt availability windows for {count} doctor profiles."))
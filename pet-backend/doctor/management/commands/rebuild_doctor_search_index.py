@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from doctor.models import DoctorProfile
+
+class Command(BaseCommand):
+    help = 'Rebuild the doctor directory search index from every doctor profile'
+
+    def handle(self, *args, **kwargs):
+        # Profile and name saves keep the index current; this backfills or repairs it
+        count = 0
+        for profile in DoctorProfile.objects.select_related('doctor').iterator(chunk_size=500):
+            profile.reindex_search_terms()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {count} doctor profiles."))
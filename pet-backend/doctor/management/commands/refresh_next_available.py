@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from doctor.models import DoctorProfile
+
+class Command(BaseCommand):
+    help = 'Recompute next_available_at and open_slots_count for every doctor profile'
+
+    def handle(self, *args, **kwargs):
+        # Booking signals keep these fresh, but slots also expire as time passes; run this periodically
+        count = 0
+        for profile in DoctorProfile.objects.iterator(chunk_size=500):
+            profile.refresh_next_available()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Refreshed next available slot for {count} doctor profiles."))
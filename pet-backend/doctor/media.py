@@ -0,0 +1,101 @@
+from contextvars import ContextVar
+import logging
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from utils.outbox import claim_batch, record_failures
+from .models import MediaDeletion
+
+logger = logging.getLogger(__name__)
+
+CERTIFICATE_FOLDER = 'doctor_certificates'
+# The media API's bulk delete accepts at most this many public ids per call
+DELETE_BATCH_SIZE = 100
+# True while a bulk delete runs whose files were already queued in one INSERT
+files_queued = ContextVar('files_queued', default=False)
+
+
+def certificate_public_id(file_url):
+    """Media public id of an uploaded certificate, from its delivery URL."""
+    name = file_url.split('/')[-1].split('.')[0]
+    return f"{CERTIFICATE_FOLDER}/{name}"
+
+
+# Per-file outcomes of a bulk delete that mean the file is gone
+DELETED_STATUSES = {'deleted', 'not_found'}
+
+
+class CloudinaryMedia:
+    """
+    Deletes files from Cloudinary with its bulk delete_resources call.
+
+    A media backend's delete(public_ids) returns the ids it could not
+    delete; raising means none of them were.
+    """
+
+    def delete(self, public_ids):
+        import cloudinary.api
+        failed = []
+        for start in range(0, len(public_ids), DELETE_BATCH_SIZE):
+            batch = public_ids[start:start + DELETE_BATCH_SIZE]
+            # {'deleted': {public_id: 'deleted' | 'not_found' | ...}}
+            outcomes = cloudinary.api.delete_resources(batch).get('deleted', {})
+            failed += [public_id for public_id in batch if outcomes.get(public_id) not in DELETED_STATUSES]
+        return failed
+
+
+def get_media_backend():
+    return import_string(settings.MEDIA_DELETE_BACKEND)()
+
+
+def queue_deletion(public_ids):
+    """
+    Records files to delete in the MediaDeletion outbox. Called inside the
+    transaction that drops their references, so a rollback drops the
+    deletions too and a commit makes them durable.
+    """
+    MediaDeletion.objects.bulk_create([MediaDeletion(public_id=public_id) for public_id in public_ids])
+
+
+def dispatch_batch(backend, batch_size=DELETE_BATCH_SIZE, now=None):
+    """
+    Deletes one batch of due files with a single bulk call, outside any
+    transaction. Files the backend reports as not deleted are retried like
+    a failed call. Returns (rows claimed, rows deleted).
+    """
+    now = now or timezone.now()
+    rows = claim_batch(MediaDeletion, ['public_id'], batch_size, now)
+    if not rows:
+        return 0, 0
+
+    try:
+        # The same file may be queued twice; deleting it once is enough
+        failed = set(backend.delete(list(dict.fromkeys(public_id for _, _, public_id in rows))))
+    except Exception as e:
+        logger.warning("Deleting %d media files failed, will retry: %s", len(rows), e)
+        record_failures(MediaDeletion, [(pk, attempts, e) for pk, attempts, _ in rows], now)
+        return len(rows), 0
+
+    if failed:
+        logger.warning("%d media files were not deleted, will retry", len(failed))
+        record_failures(MediaDeletion, [
+            (pk, attempts, "Not deleted by the media API") for pk, attempts, public_id in rows if public_id in failed
+        ], now)
+    done = [pk for pk, _, public_id in rows if public_id not in failed]
+    MediaDeletion.objects.filter(pk__in=done).delete()
+    return len(rows), len(done)
+
+
+def dispatch_deletions(batch_size=DELETE_BATCH_SIZE, now=None):
+    """
+    Drains every due row of the outbox batch by batch, stopping at the first
+    failed batch so an unreachable media API is not hammered. Returns the
+    number of rows deleted.
+    """
+    backend = get_media_backend()
+    total = 0
+    while True:
+        claimed, deleted = dispatch_batch(backend, batch_size, now)
+        total += deleted
+        if claimed < batch_size or deleted < claimed:
+            return total
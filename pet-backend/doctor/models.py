@@ -2,6 +2,17 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from multiselectfield import MultiSelectField
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from datetime import datetime, timedelta
+from appointments.models import Appointment
+from .availability import (
+    AVAILABILITY_WINDOW_DAYS, DAY_NAMES, DEFAULT_SLOT_MINUTES,
+    compile_available_times, compile_day, covers, format_minutes, free_slots, to_minutes,
+)
+from .cache import invalidate_profile
+from .geo import cell_for
+from .search import profile_terms
+from utils.outbox import OutboxEntry
 
 User = get_user_model()
 
@@ -21,13 +32,19 @@ class DoctorApplication(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     submitted_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save instead of re-reading the row
+        instance._loaded_status = instance.status
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            orig = DoctorApplication.objects.get(pk=self.pk)
-            if orig.status != 'approved' and self.status == 'approved':
-                self.user.role = 'doctor'
-                self.user.save()
+        if self.pk and getattr(self, '_loaded_status', None) != 'approved' and self.status == 'approved':
+            self.user.role = 'doctor'
+            self.user.save(update_fields=['role'])
         super().save(*args, **kwargs)
+        self._loaded_status = self.status
 
     def __str__(self):
         return f"{self.user.email} - {self.status}"
@@ -41,6 +58,22 @@ class Certificate(models.Model):
         return f"Certificate for {self.application.user.email}"
 
 
+class MediaDeletion(OutboxEntry):
+    """
+    Outbox of media files to delete, written in the same transaction as the
+    rows that referenced them and drained by doctor.media.dispatch_deletions.
+    """
+    public_id = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='media_deletion_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.public_id
+
+
 
 
 class DoctorProfile(models.Model):
@@ -59,13 +92,148 @@ class DoctorProfile(models.Model):
     specialization = models.CharField(max_length=100)
     available_days = MultiSelectField(choices=DAYS_OF_WEEK)
     available_times = models.JSONField(default=dict)  # Format: {"Monday": [{"from": "09:00", "to": "4:00"}]}
+    # Compiled from available_times on save: {"Monday": [[540, 960]]} in minutes since midnight
+    availability_index = models.JSONField(default=dict, blank=True, editable=False)
     years_experience = models.PositiveIntegerField()
     address = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from availability minus booked appointments, see refresh_next_available()
+    next_available_at = models.DateTimeField(null=True, blank=True, editable=False)
+    open_slots_count = models.PositiveIntegerField(default=0, editable=False)
+    # Supplied by the client; geo_cell is derived on save for ?near= searches (see doctor.geo)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geo_cell = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
+
+    # Fields the availability index and AvailabilityWindow rows are built from
+    AVAILABILITY_FIELDS = {'available_days', 'available_times'}
+    # Fields whose text is searchable, alongside the doctor's name
+    SEARCH_FIELDS = {'bio', 'specialization', 'address'}
+
+    class Meta:
+        indexes = [
+            # Plain ascending btree indexes; PostgreSQL already keeps NULLs last in ascending order
+            models.Index(fields=['next_available_at'], name='doctor_next_available_idx'),
+            models.Index(fields=['specialization', 'next_available_at'], name='doctor_spec_next_available_idx'),
+        ]
 
     def __str__(self):
         return f"{self.doctor.firstname} {self.doctor.lastname} - {self.specialization}"
 
+    def save(self, *args, **kwargs):
+        self.availability_index = compile_available_times(self.available_times or {})
+        self.next_available_at, self.open_slots_count = self.compute_next_available()
+        has_location = self.latitude is not None and self.longitude is not None
+        self.geo_cell = cell_for(self.latitude, self.longitude) if has_location else None
+        update_fields = kwargs.get('update_fields')
+        availability_changed = update_fields is None or bool(self.AVAILABILITY_FIELDS & set(update_fields))
+        if update_fields is not None and availability_changed:
+            kwargs['update_fields'] = set(update_fields) | {
+                'availability_index', 'next_available_at', 'open_slots_count'
+            }
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'geo_cell'}
+        super().save(*args, **kwargs)
+        if availability_changed:
+            self.rebuild_availability_windows()
+        if update_fields is None or self.SEARCH_FIELDS & set(update_fields):
+            self.reindex_search_terms()
+
+    def rebuild_availability_windows(self):
+        """Writes the bookable availability through to the AvailabilityWindow table."""
+        self.availability_windows.all().delete()
+        AvailabilityWindow.objects.bulk_create([
+            AvailabilityWindow(profile=self, weekday=DAY_NAMES.index(day), start_minute=start, end_minute=end)
+            for day, intervals in self.get_bookable_index().items()
+            for start, end in intervals
+        ])
+
+    def reindex_search_terms(self):
+        """Rebuilds this profile's rows in the directory search index."""
+        self.search_terms.all().delete()
+        DoctorSearchTerm.objects.bulk_create([
+            DoctorSearchTerm(profile=self, term=term, weight=weight)
+            for term, weight in profile_terms(self).items()
+        ])
+
+    def get_availability_index(self):
+        """
+        Returns the compiled availability index, compiling it in memory for
+        profiles saved before the index existed.
+        """
+        if self.available_times and not self.availability_index:
+            self.availability_index = compile_available_times(self.available_times)
+        return self.availability_index
+
+    def get_bookable_index(self):
+        """The availability index restricted to days listed in available_days."""
+        available_days = set(self.available_days or [])
+        return {
+            day: intervals for day, intervals in self.get_availability_index().items()
+            if day in available_days
+        }
+
+    def get_booked_minutes(self, start, end):
+        """
+        Maps each date in [start, end] to the minutes taken by pending or
+        accepted appointments, using a single date-range query.
+        """
+        booked = {}
+        for day, booked_time in Appointment.objects.filter(
+            doctor_id=self.doctor_id,
+            status__in=['pending', 'accepted'],
+            date__range=(start, end)
+        ).values_list('date', 'time'):
+            booked.setdefault(day, []).append(to_minutes(booked_time))
+        return booked
+
+    def compute_next_available(self, now=None):
+        """
+        Returns (first open slot as an aware datetime or None, number of open
+        slots) over the next AVAILABILITY_WINDOW_DAYS days.
+        """
+        now = timezone.localtime(now or timezone.now())
+        start = now.date()
+        end = start + timedelta(days=AVAILABILITY_WINDOW_DAYS - 1)
+        index = self.get_bookable_index()
+        if not index:
+            return None, 0
+
+        booked = self.get_booked_minutes(start, end)
+        next_available_at = None
+        open_slots = 0
+        for day, starts in free_slots(index, start, end, booked, DEFAULT_SLOT_MINUTES, now=now):
+            if next_available_at is None:
+                next_available_at = timezone.make_aware(
+                    datetime.combine(day, datetime.min.time()) + timedelta(minutes=starts[0])
+                )
+            open_slots += len(starts)
+        return next_available_at, open_slots
+
+    def refresh_next_available(self):
+        """
+        Recomputes next_available_at and open_slots_count without a full save.
+        When neither moved (a status change that frees no slot, a booking past
+        the window) nothing is written and the cached directory stays valid.
+        """
+        computed = self.compute_next_available()
+        if computed == (self.next_available_at, self.open_slots_count):
+            return
+        self.next_available_at, self.open_slots_count = computed
+        DoctorProfile.objects.filter(pk=self.pk).update(
+            next_available_at=self.next_available_at,
+            open_slots_count=self.open_slots_count
+        )
+        invalidate_profile(self.pk)
+
+    def is_available_at(self, date, time):
+        """
+        Checks a date and time against the compiled availability index without
+        parsing any time strings.
+        """
+        intervals = self.get_availability_index().get(DAY_NAMES[date.weekday()], [])
+        return covers(intervals, to_minutes(time))
+
     def set_available_times(self, day, times):
         """
         Sets or replaces available time slots for a given day.
@@ -80,7 +248,8 @@ class DoctorProfile(models.Model):
         for slot in times:
             if not isinstance(slot, dict) or 'from' not in slot or 'to' not in slot:
                 raise ValueError("Each time slot must be a dictionary with 'from' and 'to' keys.")
-        
+        compile_day(times)
+
         self.available_times[day] = times
         self.save()
 
@@ -94,9 +263,59 @@ class DoctorProfile(models.Model):
         """
         Ensure consistency between available_days and available_times.
         - No time slots should be provided for days not in available_days.
+        - Every time slot must be a valid 'HH:MM' range.
         """
-        invalid_days = [day for day in self.available_times if day not in self.available_days]
+        try:
+            index = compile_available_times(self.available_times or {})
+        except ValueError as e:
+            raise ValidationError({'available_times': str(e)})
+        invalid_days = [day for day in index if day not in self.available_days]
         if invalid_days:
             raise ValidationError(
                 f"The following days have time slots set but are not marked as available_days: {', '.join(invalid_days)}"
             )
+
+
+class AvailabilityWindow(models.Model):
+    """
+    One bookable interval of a doctor's week, normalized from available_days
+    and available_times so "available on Tuesday at 10:00" is a SQL filter.
+    Rewritten by DoctorProfile.save() whenever availability changes; bounds
+    are inclusive, as in DoctorProfile.is_available_at().
+    """
+    profile = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='availability_windows')
+    weekday = models.PositiveSmallIntegerField()  # 0 = Monday, as date.weekday()
+    start_minute = models.PositiveSmallIntegerField()
+    end_minute = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            # ?day=&time=: equality on weekday, then a range on the start
+            models.Index(fields=['weekday', 'start_minute', 'end_minute'], name='doctor_avail_window_idx'),
+        ]
+
+    def __str__(self):
+        return f"{DAY_NAMES[self.weekday]} {format_minutes(self.start_minute)}-{format_minutes(self.end_minute)}"
+
+
+class DoctorSearchTerm(models.Model):
+    """
+    Inverted index of the doctor directory: one row per distinct word of a
+    profile's name, specialization, address and bio, weighted by field (see
+    doctor.search). Kept in sync by DoctorProfile.save() and, for name
+    changes, doctor.signals.
+    """
+    profile = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('profile', 'term')
+        indexes = [
+            # Prefix lookups run as term >= word AND term < word + U+FFFF
+            # (see doctor.search.term_prefix), a range scan on this index
+            models.Index(fields=['term', 'profile'], name='doctor_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} ({self.weight}) for profile {self.profile_id}"
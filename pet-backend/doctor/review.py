@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from .media import certificate_public_id, files_queued, queue_deletion
+from .models import Certificate, DoctorApplication
+
+User = get_user_model()
+
+
+def review_applications(application_ids, status):
+    """
+    Approves or rejects the pending applications among application_ids in
+    one transaction: one UPDATE of the applications, then one UPDATE of the
+    applicants' roles on approval, or one DELETE of the certificates on
+    rejection, whose files go to the MediaDeletion outbox.
+
+    Returns (reviewed ids, skipped ids); ids that are missing or already
+    reviewed are skipped.
+    """
+    application_ids = list(dict.fromkeys(application_ids))
+    with transaction.atomic():
+        pending = dict(
+            DoctorApplication.objects.select_for_update()
+            .filter(pk__in=application_ids, status='pending')
+            .values_list('pk', 'user_id')
+        )
+        if pending:
+            DoctorApplication.objects.filter(pk__in=pending).update(status=status)
+            if status == 'approved':
+                User.objects.filter(pk__in=pending.values()).update(role='doctor')
+            else:
+                certificates = Certificate.objects.filter(application_id__in=pending)
+                queue_deletion(certificate_public_id(url) for url in certificates.values_list('file_url', flat=True))
+                # The files are queued above in one INSERT, so the post_delete receiver skips them
+                token = files_queued.set(True)
+                try:
+                    certificates.delete()
+                finally:
+                    files_queued.reset(token)
+
+    reviewed = [pk for pk in application_ids if pk in pending]
+    skipped = [pk for pk in application_ids if pk not in pending]
+    return reviewed, skipped
@@ -0,0 +1,75 @@
+import re
+from collections import Counter
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+# How much a term found in each field counts towards a profile's rank
+FIELD_WEIGHTS = {'name': 4, 'specialization': 3, 'address': 2, 'bio': 1}
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+
+_WORD = re.compile(r'\w+')
+# Sorts after any character a term can continue with
+_PREFIX_END = '\uffff'
+
+
+def tokenize(text):
+    """Lowercased words of two or more characters, in order of appearance."""
+    return [word[:MAX_TERM_LENGTH] for word in _WORD.findall((text or '').lower()) if len(word) > 1]
+
+
+def profile_terms(profile):
+    """
+    Maps each distinct term of a DoctorProfile to its weight: the sum of
+    FIELD_WEIGHTS over the fields it appears in.
+    """
+    fields = {
+        'name': f"{profile.doctor.firstname} {profile.doctor.lastname}",
+        'specialization': profile.specialization,
+        'address': profile.address,
+        'bio': profile.bio,
+    }
+    weights = Counter()
+    for field, text in fields.items():
+        for term in set(tokenize(text)):
+            weights[term] += FIELD_WEIGHTS[field]
+    return weights
+
+
+def term_prefix(word):
+    """
+    Matches search terms starting with word as a range, term >= word and
+    term < word + U+FFFF, which is an index range scan on any database;
+    LIKE 'word%' is not one under a case-insensitive or non-C collation.
+    Terms and words are both lowercased by tokenize().
+    """
+    return Q(search_terms__term__gte=word, search_terms__term__lt=word + _PREFIX_END)
+
+
+def search_profiles(queryset, query):
+    """
+    Narrows a DoctorProfile queryset to profiles matching every word of the
+    query as a term prefix, annotated with search_rank (the summed weight of
+    the matching terms). The search runs on the indexed DoctorSearchTerm
+    rows, never on the profile text. A query without searchable words
+    matches nothing.
+    """
+    words = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not words:
+        return queryset.annotate(search_rank=Value(0, output_field=IntegerField())).none()
+
+    any_word = Q()
+    for word in words:
+        any_word |= term_prefix(word)
+    # Filtering before annotating makes the aggregates see only matching terms
+    queryset = queryset.filter(any_word).annotate(
+        search_rank=Sum('search_terms__weight'),
+        **{
+            f'_matches_{i}': Max(Case(
+                When(term_prefix(word), then=1),
+                default=0,
+                output_field=IntegerField()
+            ))
+            for i, word in enumerate(words)
+        }
+    )
+    return queryset.filter(**{f'_matches_{i}': 1 for i in range(len(words))})
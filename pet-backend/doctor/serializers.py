@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from user.serializers import UserSerializer
 from .models import DoctorProfile, DoctorApplication, Certificate
-import datetime
+from .availability import find_overlap, parse_hhmm
 import os
 from django.db import transaction
 from django.contrib.auth import get_user_model
@@ -64,6 +64,16 @@ class DoctorApplicationSerializer(serializers.ModelSerializer):
 class ReviewSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=['approved', 'rejected'])
 
+
+class BulkReviewSerializer(ReviewSerializer):
+    MAX_ITEMS = 100
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_ITEMS
+    )
+
 class DoctorProfileSerializer(serializers.ModelSerializer):
     available_times = serializers.JSONField()
     available_days = serializers.MultipleChoiceField(
@@ -71,15 +81,17 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
         allow_empty=True
     )
     doctor = UserSerializer(read_only=True)
+    latitude = serializers.FloatField(min_value=-90, max_value=90, allow_null=True, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, allow_null=True, required=False)
 
     class Meta:
         model = DoctorProfile
         fields = [
             'doctor', 'bio', 'specialization',
-            'available_days', 'available_times', 'address',
-            'years_experience', 'created_at'
+            'available_days', 'available_times', 'address', 'latitude', 'longitude',
+            'years_experience', 'created_at', 'next_available_at', 'open_slots_count'
         ]
-        read_only_fields = ['doctor', 'created_at']
+        read_only_fields = ['doctor', 'created_at', 'next_available_at', 'open_slots_count']
 
     def validate_available_days(self, value):
         # Value is already a list of valid choices due to MultipleChoiceField
@@ -95,36 +107,29 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(f"'{day}' is not a valid day of the week.")
             if not isinstance(time_slots, list):
                 raise serializers.ValidationError(f"Time slots for {day} must be a list.")
+            intervals = []
             for slot in time_slots:
                 if not isinstance(slot, dict) or 'from' not in slot or 'to' not in slot:
                     raise serializers.ValidationError(
                         f"Each time slot for {day} must be a dict with 'from' and 'to' keys."
                     )
                 try:
-                    from_time = datetime.datetime.strptime(slot['from'], "%H:%M").time()
-                    to_time = datetime.datetime.strptime(slot['to'], "%H:%M").time()
+                    from_minute = parse_hhmm(slot['from'])
+                    to_minute = parse_hhmm(slot['to'])
                 except ValueError:
                     raise serializers.ValidationError(
                         f"Time format for {day} must be 'HH:MM'. Got: {slot}"
                     )
-                if from_time >= to_time:
+                if from_minute >= to_minute:
                     raise serializers.ValidationError(
                         f"'from' time must be earlier than 'to' time on {day}."
                     )
+                intervals.append([from_minute, to_minute])
             # Check for overlapping slots
-            sorted_slots = sorted(
-                [(datetime.datetime.strptime(slot['from'], "%H:%M").time(),
-                  datetime.datetime.strptime(slot['to'], "%H:%M").time())
-                 for slot in time_slots],
-                key=lambda x: x[0]
-            )
-            for i in range(1, len(sorted_slots)):
-                prev_end = sorted_slots[i - 1][1]
-                curr_start = sorted_slots[i][0]
-                if curr_start < prev_end:
-                    raise serializers.ValidationError(
-                        f"Overlapping time slots found on {day}."
-                    )
+            if find_overlap(sorted(intervals)):
+                raise serializers.ValidationError(
+                    f"Overlapping time slots found on {day}."
+                )
         return value
 
     def validate(self, data):
@@ -135,4 +140,9 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 "available_times": f"Time slots set for days not in available_days: {', '.join(invalid_days)}"
             })
+
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("latitude and longitude must be set together.")
         return data
\ No newline at end of file
@@ -1,14 +1,39 @@
-from django.db.models.signals import post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import Certificate
-import cloudinary.uploader
+from .cache import invalidate_profile
+from .media import certificate_public_id, files_queued, queue_deletion
+from .models import Certificate, DoctorProfile
 
 @receiver(post_delete, sender=Certificate)
-def delete_certificate_file_from_cloudinary(sender, instance, **kwargs):
-    # Extract the public_id from the file_url
-    if instance.file_url:
-        try:
-            public_id = instance.file_url.split('/')[-1].split('.')[0]  # crude extraction
-            cloudinary.uploader.destroy(f"doctor_certificates/{public_id}")
-        except Exception as e:
-            print(f"Error deleting from Cloudinary: {e}")
+def delete_certificate_file(sender, instance, **kwargs):
+    # Queued in the deleting transaction; dispatch_media_deletions calls the media API later
+    if instance.file_url and not files_queued.get():
+        queue_deletion([certificate_public_id(instance.file_url)])
+
+
+# CustomUser fields that DoctorProfileSerializer shows for the doctor
+DIRECTORY_USER_FIELDS = {'email', 'firstname', 'lastname', 'profilepicture', 'role'}
+
+
+@receiver(post_save, sender=get_user_model())
+def sync_doctor_directory(sender, instance, update_fields=None, **kwargs):
+    # The directory shows the doctor's user fields and searches their name; a
+    # doctor who was just demoted still has a cached profile to invalidate
+    changed = None if update_fields is None else set(update_fields)
+    roles = {instance.role, getattr(instance, '_loaded_role', None)}
+    if 'doctor' not in roles or (changed is not None and not DIRECTORY_USER_FIELDS & changed):
+        return
+    profile = DoctorProfile.objects.filter(doctor=instance).first()
+    if not profile:
+        return
+    invalidate_profile(profile.pk)
+    if changed is None or {'firstname', 'lastname'} & changed:
+        profile.doctor = instance
+        profile.reindex_search_terms()
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def invalidate_directory_cache(sender, instance, **kwargs):
+    invalidate_profile(instance.pk)
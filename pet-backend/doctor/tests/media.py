@@ -0,0 +1,27 @@
+class LocalMedia:
+    """
+    In-process stand-in for the media API. Every delete call is recorded in
+    `calls`; setting `failures` makes that many following calls raise, like
+    an unreachable server, and public ids in `undeletable` are reported back
+    as not deleted.
+    """
+    calls = []
+    failures = 0
+    undeletable = set()
+
+    def delete(self, public_ids):
+        if LocalMedia.failures:
+            LocalMedia.failures -= 1
+            raise ConnectionError("Media server unavailable")
+        LocalMedia.calls.append(list(public_ids))
+        return [public_id for public_id in public_ids if public_id in LocalMedia.undeletable]
+
+    @classmethod
+    def deleted(cls):
+        return [public_id for call in cls.calls for public_id in call if public_id not in cls.undeletable]
+
+    @classmethod
+    def reset(cls):
+        cls.calls.clear()
+        cls.failures = 0
+        cls.undeletable = set()
@@ -0,0 +1,102 @@
+from datetime import date, datetime, time
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from doctor.availability import free_slots
+from doctor.geo import cell_for, cell_ranges, nearest
+from doctor.models import DoctorProfile
+
+User = get_user_model()
+
+class DoctorProfileAvailabilityTests(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user(
+            email="vet@example.com",
+            firstname="Ada",
+            lastname="Vet",
+            password="pass12345",
+            role="doctor"
+        )
+        self.profile = DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday", "Wednesday"],
+            available_times={
+                "Monday": [{"from": "13:00", "to": "17:00"}, {"from": "09:00", "to": "12:00"}],
+                "Wednesday": [{"from": "9:00", "to": "11:30"}],
+            },
+            years_experience=4,
+            address="1 Main St"
+        )
+
+    def test_index_is_compiled_on_save(self):
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.availability_index, {
+            "Monday": [[540, 720], [780, 1020]],
+            "Wednesday": [[540, 690]],
+        })
+
+    def test_is_available_at_uses_inclusive_bounds(self):
+        monday = date(2030, 1, 7)
+        self.assertTrue(self.profile.is_available_at(monday, time(9, 0)))
+        self.assertTrue(self.profile.is_available_at(monday, time(17, 0)))
+        self.assertFalse(self.profile.is_available_at(monday, time(12, 30)))
+        self.assertFalse(self.profile.is_available_at(monday, time(8, 59)))
+        self.assertFalse(self.profile.is_available_at(date(2030, 1, 8), time(10, 0)))
+
+    def test_set_available_times_recompiles_index(self):
+        self.profile.set_available_times("Wednesday", [{"from": "14:00", "to": "15:00"}])
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.availability_index["Wednesday"], [[840, 900]])
+
+    def test_set_available_times_rejects_bad_time(self):
+        with self.assertRaises(ValueError):
+            self.profile.set_available_times("Monday", [{"from": "9am", "to": "12:00"}])
+
+    def test_legacy_profile_without_index_is_compiled_on_read(self):
+        DoctorProfile.objects.filter(pk=self.profile.pk).update(availability_index={})
+        profile = DoctorProfile.objects.get(pk=self.profile.pk)
+        self.assertTrue(profile.is_available_at(date(2030, 1, 9), time(10, 0)))
+
+    def test_clean_rejects_invalid_time_format(self):
+        self.profile.available_times = {"Monday": [{"from": "25:00", "to": "26:00"}]}
+        with self.assertRaises(ValidationError):
+            self.profile.clean()
+
+
+class FreeSlotsTests(SimpleTestCase):
+    index = {"Monday": [[540, 660]]}
+    monday = date(2030, 1, 7)
+
+    def test_slots_after_an_odd_booking_stay_on_the_grid(self):
+        slots = free_slots(self.index, self.monday, self.monday, {self.monday: [550]}, 30)
+        self.assertEqual(slots, [(self.monday, [600, 630])])
+
+    def test_slots_that_have_started_are_dropped(self):
+        sunday = date(2030, 1, 6)
+        now = datetime(2030, 1, 7, 9, 40, 10)
+        self.assertEqual(free_slots(self.index, sunday, self.monday, {}, 30, now=now), [(self.monday, [600, 630])])
+        now = datetime(2030, 1, 7, 9, 30)
+        self.assertEqual(free_slots(self.index, self.monday, self.monday, {}, 30, now=now), [(self.monday, [570, 600, 630])])
+        self.assertEqual(free_slots(self.index, self.monday, self.monday, {}, 30, now=datetime(2030, 1, 8)), [])
+
+
+class GeoGridTests(SimpleTestCase):
+    def test_cell_ranges_cover_points_within_radius(self):
+        lagos = (6.5244, 3.3792)
+        ranges = cell_ranges(*lagos, 30)
+        for point in [(6.70, 3.40), (6.40, 3.20), (6.52, 3.60)]:
+            self.assertLessEqual(nearest([(1, *point)], *lagos, 30)[0][0], 30)
+            cell = cell_for(*point)
+            self.assertTrue(any(first <= cell <= last for first, last in ranges))
+
+    def test_cell_ranges_wrap_around_the_antimeridian(self):
+        ranges = cell_ranges(0.0, 179.95, 20)
+        cell = cell_for(0.0, -179.95)
+        self.assertTrue(any(first <= cell <= last for first, last in ranges))
+
+    def test_nearest_sorts_and_drops_points_outside_radius(self):
+        found = nearest([(1, 6.60, 3.38), (2, 6.53, 3.38), (3, 9.07, 7.49)], 6.5244, 3.3792, 20)
+        self.assertEqual([pk for _, pk in found], [2, 1])
+        self.assertAlmostEqual(found[1][0], 8.4, delta=0.1)
@@ -0,0 +1,47 @@
+from unittest import skipUnless
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from doctor.models import DoctorProfile
+from doctor.search import search_profiles
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class SearchQueryPlanTests(TestCase):
+    """Directory search must find term prefixes with a range scan of the term index."""
+
+    def test_term_prefix_is_an_index_range_scan(self):
+        plan = search_profiles(DoctorProfile.objects.all(), "sur").explain()
+        self.assertIn("USING INDEX doctor_search_term_idx (term>? AND term<?)", plan, f"Query plan:\n{plan}")
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class NextAvailableQueryPlanTests(TestCase):
+    """The directory's next-available ordering must walk an index instead of sorting."""
+
+    def list_plan(self, **params):
+        cache.clear()  # a cached page would run no query
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get('/api/doctorprofiles/', {'ordering': 'next_available', **params})
+        self.assertEqual(response.status_code, 200)
+        sql = next(query['sql'] for query in queries if 'ORDER BY "doctor_doctorprofile"."next_available_at"' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return sql, "\n".join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, query, index_name):
+        sql, plan = query
+        # NULLS LAST (or its IS NULL emulation) keeps other backends off the index
+        order_by = sql.rsplit('ORDER BY', 1)[1]
+        self.assertNotIn("NULLS LAST", order_by, sql)
+        self.assertNotIn("IS NULL", order_by, sql)
+        self.assertIn(index_name, plan, f"Query plan:\n{plan}")
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, f"Query plan sorts rows:\n{plan}")
+
+    def test_next_available_ordering(self):
+        self.assertUsesIndex(self.list_plan(), 'doctor_next_available_idx')
+
+    def test_next_available_ordering_within_a_specialization(self):
+        self.assertUsesIndex(self.list_plan(specialization='Surgery'), 'doctor_spec_next_available_idx')
@@ -0,0 +1,556 @@
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import http_date
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from appointments.models import Appointment
+from doctor.cache import profile_version
+from doctor.media import CloudinaryMedia, dispatch_deletions
+from doctor.models import Certificate, DoctorApplication, DoctorProfile, MediaDeletion
+from doctor.tests.media import LocalMedia
+from utils.outbox import retry_delay
+
+User = get_user_model()
+
+def next_weekday(weekday):
+    today = date.today()
+    return today + timedelta(days=(weekday - today.weekday()) % 7 or 7)
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DoctorProfileFreeSlotsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.doctor = User.objects.create_user(
+            email="vet@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        self.profile = DoctorProfile.objects.create(
+            doctor=self.doctor,
+            bio="Small animals",
+            specialization="Surgery",
+            available_days=["Monday"],
+            available_times={"Monday": [{"from": "09:00", "to": "11:00"}]},
+            years_experience=4,
+            address="1 Main St"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.monday = next_weekday(0)
+        self.url = f"/api/doctorprofiles/{self.profile.pk}/free-slots/"
+
+    def test_booked_appointments_are_subtracted(self):
+        Appointment.objects.create(user=self.user, doctor=self.doctor, date=self.monday, time=time(9, 30))
+        Appointment.objects.create(
+            user=self.user, doctor=self.doctor, date=self.monday, time=time(10, 0), status='rejected'
+        )
+        response = self.client.get(self.url, {
+            'from': self.monday.isoformat(), 'to': self.monday.isoformat(), 'granularity': 30
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['slots'], [
+            {"date": self.monday, "times": ["09:00", "10:00", "10:30"]}
+        ])
+
+    def test_days_without_availability_are_omitted(self):
+        response = self.client.get(self.url, {
+            'from': self.monday.isoformat(), 'to': (self.monday + timedelta(days=6)).isoformat()
+        })
+        self.assertEqual([slot['date'] for slot in response.data['slots']], [self.monday])
+
+    def test_invalid_range_is_rejected(self):
+        response = self.client.get(self.url, {
+            'from': self.monday.isoformat(), 'to': (self.monday + timedelta(days=60)).isoformat()
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DoctorProfileNextAvailableTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.monday = next_weekday(0)
+
+    def make_doctor(self, email, specialization, available_times):
+        doctor = User.objects.create_user(
+            email=email, firstname="Doc", lastname="Tor", password="pass12345", role="doctor"
+        )
+        return DoctorProfile.objects.create(
+            doctor=doctor,
+            bio="Vet",
+            specialization=specialization,
+            available_days=list(available_times),
+            available_times=available_times,
+            years_experience=3,
+            address="1 Main St"
+        )
+
+    def test_booking_moves_next_available(self):
+        profile = self.make_doctor("a@example.com", "Surgery", {"Monday": [{"from": "09:00", "to": "10:00"}]})
+        open_slots = profile.open_slots_count
+        first_slot = profile.next_available_at
+
+        appointment = Appointment.objects.create(
+            user=self.user, doctor=profile.doctor, date=first_slot.date(), time=first_slot.time()
+        )
+        profile.refresh_from_db()
+        self.assertEqual(profile.open_slots_count, open_slots - 1)
+        self.assertEqual(profile.next_available_at, first_slot + timedelta(minutes=30))
+
+        appointment.delete()
+        profile.refresh_from_db()
+        self.assertEqual(profile.next_available_at, first_slot)
+
+    def test_reassigning_refreshes_both_doctors(self):
+        hours = {"Monday": [{"from": "09:00", "to": "10:00"}]}
+        old = self.make_doctor("a@example.com", "Surgery", hours)
+        new = self.make_doctor("b@example.com", "Surgery", hours)
+        open_slots = old.open_slots_count
+        first_slot = old.next_available_at
+        Appointment.objects.create(user=self.user, doctor=old.doctor, date=first_slot.date(), time=first_slot.time())
+
+        appointment = Appointment.objects.get()
+        appointment.doctor = new.doctor
+        appointment.save()
+        old.refresh_from_db()
+        new.refresh_from_db()
+        self.assertEqual((old.open_slots_count, old.next_available_at), (open_slots, first_slot))
+        self.assertEqual(new.open_slots_count, open_slots - 1)
+
+    def test_unchanged_next_available_skips_the_write_and_invalidation(self):
+        profile = self.make_doctor("a@example.com", "Surgery", {"Monday": [{"from": "09:00", "to": "10:00"}]})
+        first_slot = profile.next_available_at
+        appointment = Appointment.objects.create(
+            user=self.user, doctor=profile.doctor, date=first_slot.date(), time=first_slot.time()
+        )
+        version = profile_version(profile.pk)
+
+        # Accepting keeps the slot taken, so nothing the directory shows moves
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'accepted'
+            appointment.save()
+        self.assertEqual(profile_version(profile.pk), version)
+        with self.assertNumQueries(2):  # the profile and its bookings, with no UPDATE
+            DoctorProfile.objects.get(pk=profile.pk).refresh_next_available()
+
+    def test_list_filters_and_sorts_by_next_available(self):
+        in_two_days = (date.today() + timedelta(days=2)).strftime('%A')
+        later = self.make_doctor("b@example.com", "Surgery", {in_two_days: [{"from": "09:00", "to": "12:00"}]})
+        sooner = self.make_doctor("c@example.com", "Surgery", {
+            day: [{"from": "00:00", "to": "23:59"}]
+            for day in ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        })
+        never = self.make_doctor("d@example.com", "Surgery", {})
+        self.make_doctor("e@example.com", "Dentistry", {"Monday": [{"from": "09:00", "to": "12:00"}]})
+
+        response = self.client.get('/api/doctorprofiles/', {'specialization': 'Surgery', 'ordering': 'next_available'})
+        self.assertEqual(
+            [profile['doctor']['email'] for profile in response.data['results']],
+            [sooner.doctor.email, later.doctor.email]
+        )
+        self.assertIsNone(never.next_available_at)
+
+        # Walking the keyset pages one row at a time gives the same order
+        emails, url = [], '/api/doctorprofiles/?specialization=Surgery&ordering=next_available&page_size=1'
+        while url:
+            response = self.client.get(url)
+            emails += [profile['doctor']['email'] for profile in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(emails, [sooner.doctor.email, later.doctor.email])
+
+
+class DoctorProfileSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()  # anonymous requests are throttled per cache window
+        self.profiles = {}
+        for email, first, last, specialization, bio, address in [
+            ("ada@example.com", "Ada", "Vet", "Surgery", "Orthopedic surgery for dogs", "1 Main St, Lagos"),
+            ("sam@example.com", "Sam", "Surgeon", "Dermatology", "Skin and coat care for cats", "5 Bay Rd, Abuja"),
+            ("kim@example.com", "Kim", "Moss", "Dentistry", "Dental cleaning for dogs and cats", "9 Hill Ave, Lagos"),
+        ]:
+            doctor = User.objects.create_user(
+                email=email, firstname=first, lastname=last, password="pass12345", role="doctor"
+            )
+            self.profiles[first] = DoctorProfile.objects.create(
+                doctor=doctor, bio=bio, specialization=specialization, available_days=[],
+                available_times={}, years_experience=3, address=address
+            )
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        response = self.client.get('/api/doctorprofiles/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def names(self, response):
+        return [profile['doctor']['firstname'] for profile in response.data['results']]
+
+    def test_all_words_must_match_and_rank_by_field_weight(self):
+        # "surg" names Sam (weight 4) and is Ada's specialization and bio (3 + 1)
+        self.assertEqual(self.names(self.search("surg")), ["Ada", "Sam"])
+        self.assertEqual(self.names(self.search("dogs lagos")), ["Ada", "Kim"])
+        self.assertEqual(self.names(self.search("cats LAGOS")), ["Kim"])
+        self.assertEqual(self.names(self.search("?!")), [])
+
+    def test_ranked_results_are_paginated(self):
+        response = self.search("for", page_size=2)
+        first_page = self.names(response)
+        self.assertEqual(len(first_page), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(self.names(response)) + len(first_page), 3)
+        self.assertNotIn(self.names(response)[0], first_page)
+
+    def test_index_follows_profile_and_name_changes(self):
+        profile = self.profiles["Kim"]
+        profile.specialization = "Cardiology"
+        profile.save()
+        self.assertEqual(self.names(self.search("cardio")), ["Kim"])
+        self.assertEqual(self.names(self.search("dentistry")), [])
+
+        profile.doctor.lastname = "Okafor"
+        profile.doctor.save()
+        self.assertEqual(self.names(self.search("okafor")), ["Kim"])
+        self.assertEqual(self.names(self.search("moss")), [])
+
+
+class DoctorProfileNearTests(TestCase):
+    def setUp(self):
+        cache.clear()  # anonymous requests are throttled per cache window
+        # (first name, latitude, longitude): Lagos, Ikeja (about 17 km away), Abuja
+        for first, lat, lng in [("Ada", 6.4541, 3.3947), ("Kim", 6.6018, 3.3515), ("Sam", 9.0765, 7.3986)]:
+            doctor = User.objects.create_user(
+                email=f"{first.lower()}@example.com", firstname=first, lastname="Vet", password="pass12345", role="doctor"
+            )
+            DoctorProfile.objects.create(
+                doctor=doctor, bio="Vet", specialization="Surgery", available_days=[], available_times={},
+                years_experience=3, address="Somewhere", latitude=lat, longitude=lng
+            )
+        unplaced = User.objects.create_user(
+            email="lee@example.com", firstname="Lee", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=unplaced, bio="Vet", specialization="Surgery", available_days=[], available_times={},
+            years_experience=3, address="Somewhere"
+        )
+        self.client = APIClient()
+
+    def test_near_returns_profiles_within_radius_nearest_first(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/doctorprofiles/', {'near': '6.45,3.39', 'radius': 25})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([profile['doctor']['firstname'] for profile in results], ["Ada", "Kim"])
+        self.assertLess(results[0]['distance_km'], 1)
+        self.assertAlmostEqual(results[1]['distance_km'], 17, delta=1)
+
+        response = self.client.get('/api/doctorprofiles/', {'near': '6.45,3.39', 'radius': 25, 'page_size': 1})
+        self.assertEqual([profile['doctor']['firstname'] for profile in response.data['results']], ["Ada"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([profile['doctor']['firstname'] for profile in response.data['results']], ["Kim"])
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_point_or_radius_is_rejected(self):
+        for params in [{'near': 'lagos'}, {'near': '95,3'}, {'near': '6,3', 'radius': 500}]:
+            self.assertEqual(self.client.get('/api/doctorprofiles/', params).status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DoctorDirectoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profiles = []
+        for first in ["Ada", "Kim"]:
+            doctor = User.objects.create_user(
+                email=f"{first.lower()}@example.com", firstname=first, lastname="Vet", password="pass12345", role="doctor"
+            )
+            self.profiles.append(DoctorProfile.objects.create(
+                doctor=doctor, bio="Vet", specialization="Surgery", available_days=["Monday"],
+                available_times={"Monday": [{"from": "09:00", "to": "12:00"}]}, years_experience=3, address="Somewhere"
+            ))
+        self.client = APIClient()
+
+    def test_repeat_and_conditional_requests_skip_the_database(self):
+        response = self.client.get('/api/doctorprofiles/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/doctorprofiles/')
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(cached['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/doctorprofiles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Only the ETag validates: a date cannot tell apart two edits within one second
+        later = http_date((timezone.now() + timedelta(hours=1)).timestamp())
+        self.assertEqual(self.client.get('/api/doctorprofiles/', HTTP_IF_MODIFIED_SINCE=later).status_code, 200)
+
+    def test_profile_and_user_changes_invalidate_precisely(self):
+        ada, kim = self.profiles
+        list_etag = self.client.get('/api/doctorprofiles/')['ETag']
+        ada_etag = self.client.get(f'/api/doctorprofiles/{ada.pk}/')['ETag']
+        kim_etag = self.client.get(f'/api/doctorprofiles/{kim.pk}/')['ETag']
+
+        kim.doctor.firstname = "Kimberly"
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            version = profile_version(kim.pk)
+            kim.doctor.save()
+            # Not before the commit, or a concurrent request could cache the old name under the new version
+            self.assertEqual(profile_version(kim.pk), version)
+        self.assertEqual(len(callbacks), 1)
+        response = self.client.get(f'/api/doctorprofiles/{kim.pk}/', HTTP_IF_NONE_MATCH=kim_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['doctor']['firstname'], "Kimberly")
+        self.assertEqual(self.client.get(f'/api/doctorprofiles/{ada.pk}/', HTTP_IF_NONE_MATCH=ada_etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/doctorprofiles/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+        # A booking moves Ada's next available slot, which the directory shows
+        ada_etag = self.client.get(f'/api/doctorprofiles/{ada.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(user=kim.doctor, doctor=ada.doctor, date=next_weekday(0), time=time(9, 0))
+        self.assertEqual(self.client.get(f'/api/doctorprofiles/{ada.pk}/', HTTP_IF_NONE_MATCH=ada_etag).status_code, 200)
+
+        # Logging in touches only last_login, which the directory doesn't show
+        ada_etag = self.client.get(f'/api/doctorprofiles/{ada.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ada.doctor.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(f'/api/doctorprofiles/{ada.pk}/', HTTP_IF_NONE_MATCH=ada_etag).status_code, 304)
+
+    def test_demoting_a_doctor_invalidates_their_profile(self):
+        kim = self.profiles[1]
+        kim_etag = self.client.get(f'/api/doctorprofiles/{kim.pk}/')['ETag']
+
+        doctor = User.objects.get(pk=kim.doctor_id)
+        doctor.role = 'user'
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.save(update_fields=['role'])
+        response = self.client.get(f'/api/doctorprofiles/{kim.pk}/', HTTP_IF_NONE_MATCH=kim_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['doctor']['role'], 'user')
+
+        # Neither the old nor the new role is doctor now
+        version = profile_version(kim.pk)
+        doctor.firstname = "Kimberly"
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.save()
+        self.assertEqual(profile_version(kim.pk), version)
+
+    def test_missing_profile_is_not_cached(self):
+        self.assertEqual(self.client.get('/api/doctorprofiles/999/').status_code, 404)
+        self.assertNotIn('ETag', self.client.get('/api/doctorprofiles/999/'))
+
+
+class DoctorProfileAvailabilityFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(
+            email="ada@example.com", firstname="Ada", lastname="Vet", password="pass12345", role="doctor"
+        )
+        self.profile = DoctorProfile.objects.create(
+            doctor=self.doctor, bio="Vet", specialization="Surgery", years_experience=3, address="Somewhere",
+            available_days=["Tuesday", "Friday"],
+            available_times={
+                "Tuesday": [{"from": "09:00", "to": "12:00"}, {"from": "11:00", "to": "13:00"}],
+                "Friday": [{"from": "14:00", "to": "17:00"}],
+            }
+        )
+        other = User.objects.create_user(
+            email="kim@example.com", firstname="Kim", lastname="Vet", password="pass12345", role="doctor"
+        )
+        DoctorProfile.objects.create(
+            doctor=other, bio="Vet", specialization="Surgery", years_experience=3, address="Somewhere",
+            available_days=["Monday"], available_times={"Monday": [{"from": "09:00", "to": "17:00"}]}
+        )
+        self.client = APIClient()
+
+    def names(self, **params):
+        response = self.client.get('/api/doctorprofiles/', params)
+        self.assertEqual(response.status_code, 200)
+        return [profile['doctor']['firstname'] for profile in response.data['results']]
+
+    def test_windows_are_written_through_from_the_serializer(self):
+        self.assertEqual(
+            sorted(self.profile.availability_windows.values_list('weekday', 'start_minute', 'end_minute')),
+            [(1, 540, 780), (4, 840, 1020)]
+        )
+        self.client.force_authenticate(self.doctor)
+        response = self.client.put('/api/doctorprofiles/me/', {
+            'available_days': ["Tuesday"],
+            'available_times': {"Tuesday": [{"from": "15:00", "to": "16:00"}]},
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(list(self.profile.availability_windows.values_list('weekday', 'start_minute')), [(1, 900)])
+
+    def test_day_and_time_filters_run_in_sql(self):
+        self.assertEqual(self.names(day="tuesday", time="12:30"), ["Ada"])
+        self.assertEqual(self.names(day="Tuesday", time="13:30"), [])
+        self.assertEqual(self.names(day="Monday"), ["Kim"])
+        self.assertEqual(self.names(time="15:00"), ["Ada", "Kim"])
+        with self.assertNumQueries(1):
+            self.names(day="Friday", time="09:00")
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/doctorprofiles/', {'day': 'Someday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/doctorprofiles/', {'time': '25:00'}).status_code, 400)
+
+
+@override_settings(MEDIA_DELETE_BACKEND='doctor.tests.media.LocalMedia')
+class DoctorApplicationReviewTests(TestCase):
+    def setUp(self):
+        LocalMedia.reset()
+        self.staff = User.objects.create_superuser(
+            email="staff@example.com", firstname="Sam", lastname="Staff", password="pass12345"
+        )
+        self.applications = []
+        for i in range(3):
+            user = User.objects.create_user(
+                email=f"applicant{i}@example.com", firstname="App", lastname=f"{i}", password="pass12345"
+            )
+            application = DoctorApplication.objects.create(user=user, bio="Vet", specialization="Surgery")
+            Certificate.objects.create(
+                application=application, file_url=f"https://res.cloudinary.com/demo/doctor_certificates/cert{i}.pdf"
+            )
+            self.applications.append(application)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_bulk_approve_updates_roles_in_one_transaction(self):
+        first, second, third = self.applications
+        third.status = 'rejected'
+        third.save()
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/applications/bulk-review/', {
+                'ids': [first.pk, second.pk, third.pk, 999], 'status': 'approved'
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['reviewed'], [first.pk, second.pk])
+        self.assertEqual(response.data['skipped'], [third.pk, 999])
+        self.assertEqual(
+            sorted(User.objects.filter(role='doctor').values_list('email', flat=True)),
+            ["applicant0@example.com", "applicant1@example.com"]
+        )
+        self.assertEqual(Certificate.objects.count(), 3)
+
+    def test_rejection_queues_certificate_files_in_the_outbox(self):
+        ids = [application.pk for application in self.applications[:2]]
+        response = self.client.post('/api/applications/bulk-review/', {
+            'ids': ids, 'status': 'rejected'
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(LocalMedia.calls, [])
+        self.assertEqual(
+            sorted(MediaDeletion.objects.values_list('public_id', flat=True)),
+            ["doctor_certificates/cert0", "doctor_certificates/cert1"]
+        )
+        self.assertEqual(Certificate.objects.count(), 1)
+        self.assertFalse(User.objects.filter(role='doctor').exists())
+
+    def test_single_review_and_permissions(self):
+        application = self.applications[0]
+        response = self.client.post(f'/api/applications/{application.pk}/review/', {'status': 'approved'})
+        self.assertEqual(response.status_code, 200, response.data)
+        application.user.refresh_from_db()
+        self.assertEqual(application.user.role, 'doctor')
+
+        response = self.client.post(f'/api/applications/{application.pk}/review/', {'status': 'rejected'})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(application.user)
+        response = self.client.post('/api/applications/bulk-review/', {
+            'ids': [self.applications[1].pk], 'status': 'approved'
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_saving_an_approved_application_does_not_reread_it(self):
+        application = DoctorApplication.objects.select_related('user').get(pk=self.applications[0].pk)
+        application.status = 'approved'
+        # Role update, the directory sync's profile lookup, and the application update
+        with self.assertNumQueries(3):
+            application.save()
+        application.user.refresh_from_db()
+        self.assertEqual(application.user.role, 'doctor')
+
+
+@override_settings(MEDIA_DELETE_BACKEND='doctor.tests.media.LocalMedia')
+class MediaDeletionOutboxTests(TestCase):
+    def setUp(self):
+        LocalMedia.reset()
+        user = User.objects.create_user(
+            email="applicant@example.com", firstname="App", lastname="Licant", password="pass12345"
+        )
+        self.application = DoctorApplication.objects.create(user=user, bio="Vet", specialization="Surgery")
+        for i in range(5):
+            Certificate.objects.create(
+                application=self.application, file_url=f"https://res.cloudinary.com/demo/doctor_certificates/cert{i}.pdf"
+            )
+
+    def test_deletions_roll_back_with_the_transaction(self):
+        try:
+            with transaction.atomic():
+                Certificate.objects.first().delete()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(MediaDeletion.objects.exists())
+
+        Certificate.objects.first().delete()
+        self.assertEqual(MediaDeletion.objects.count(), 1)
+
+    def test_dispatcher_deletes_in_bulk_batches(self):
+        Certificate.objects.all().delete()
+        self.assertEqual(dispatch_deletions(batch_size=2), 5)
+        self.assertEqual([len(call) for call in LocalMedia.calls], [2, 2, 1])
+        self.assertEqual(len(set(LocalMedia.deleted())), 5)
+        self.assertFalse(MediaDeletion.objects.exists())
+
+    def test_files_the_api_did_not_delete_are_retried(self):
+        Certificate.objects.all().delete()
+        LocalMedia.undeletable = {"doctor_certificates/cert0"}
+        now = timezone.now()
+
+        self.assertEqual(dispatch_deletions(now=now), 4)
+        deletion = MediaDeletion.objects.get()
+        self.assertEqual(deletion.public_id, "doctor_certificates/cert0")
+        self.assertEqual((deletion.attempts, deletion.next_attempt_at), (1, now + retry_delay(1)))
+
+    def test_cloudinary_reports_ids_neither_deleted_nor_missing(self):
+        outcomes = {'deleted': {'a': 'deleted', 'b': 'not_found', 'c': 'rate_limited'}}
+        with mock.patch('cloudinary.api.delete_resources', return_value=outcomes):
+            self.assertEqual(CloudinaryMedia().delete(['a', 'b', 'c', 'd']), ['c', 'd'])
+
+    def test_failures_back_off_exponentially(self):
+        Certificate.objects.all().delete()
+        now = timezone.now()
+        LocalMedia.failures = 2
+
+        self.assertEqual(dispatch_deletions(now=now), 0)
+        deletion = MediaDeletion.objects.first()
+        self.assertEqual(deletion.attempts, 1)
+        self.assertEqual(deletion.next_attempt_at, now + retry_delay(1))
+        self.assertIn("unavailable", deletion.last_error)
+        # Not due yet
+        self.assertEqual(dispatch_deletions(now=now + retry_delay(1) / 2), 0)
+        self.assertEqual(LocalMedia.failures, 1)
+
+        later = now + retry_delay(1)
+        self.assertEqual(dispatch_deletions(now=later), 0)
+        self.assertEqual(MediaDeletion.objects.first().next_attempt_at, later + retry_delay(2))
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+
+        out = StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=later + retry_delay(2)):
+            call_command('dispatch_media_deletions', stdout=out)
+        self.assertIn("Deleted 5 media files", out.getvalue())
+        self.assertFalse(MediaDeletion.objects.exists())
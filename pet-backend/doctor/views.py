@@ -1,7 +1,14 @@
 from rest_framework import viewsets, permissions, status
-from rest_framework.exceptions import PermissionDenied, NotFound
-from .models import DoctorProfile, DoctorApplication
-from .serializers import DoctorProfileSerializer, DoctorApplicationSerializer
+from rest_framework.exceptions import PermissionDenied, NotFound, ParseError
+from .models import AvailabilityWindow, DoctorProfile, DoctorApplication
+from .availability import DAY_NAMES, DEFAULT_SLOT_MINUTES, format_minutes, free_slots, parse_hhmm
+from .cache import cached_response, directory_version, profile_version
+from .geo import DEFAULT_RADIUS_KM, MAX_RADIUS_KM, cell_ranges, nearest, parse_point
+from .review import review_applications
+from .search import search_profiles
+from .serializers import (
+    BulkReviewSerializer, DoctorProfileSerializer, DoctorApplicationSerializer, ReviewSerializer,
+)
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from rest_framework.response import Response
@@ -9,9 +16,18 @@ from rest_framework.decorators import action
 import json
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from utils.auth import get_safe_user
+from utils.pagination import KeysetPagination
+from utils.queries import QueryBudgetMixin
 from rest_framework.views import APIView
 import cloudinary
 import time
+from functools import partial
+from datetime import date, timedelta
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+FREE_SLOTS_MAX_DAYS = 31
+FREE_SLOTS_DEFAULT_DAYS = 7
 
 
 class GenerateCloudinarySignatureView(APIView):
@@ -89,36 +105,39 @@ class DoctorApplicationViewSet(viewsets.ModelViewSet):
         if application.status in ['approved', 'rejected']:
             return Response({"detail": f"Application is already {application.status}."}, status=400)
 
-        with transaction.atomic():
-            application.status = status_value
-            application.save()
-
-            if status_value == 'approved':
-                application.user.role = 'doctor'
-                application.user.save()
-
-            elif status_value == 'rejected':
-                # delete the certificates and files from Cloudinary
-                for cert in application.certificate_files.all():
-                    try:
-                        public_id = cert.file_url.split('/')[-1].split('.')[0]
-                        cloudinary.uploader.destroy(f"doctor_certificates/{public_id}")
-                        cert.delete()
-                    except Exception as e:
-                        print(f"Error cleaning certificate: {e}")
-
+        reviewed, _ = review_applications([application.pk], status_value)
+        if not reviewed:
+            # Reviewed by someone else since it was read
+            return Response({"detail": "Application has already been reviewed."}, status=400)
         return Response({"detail": f"Application {status_value} successfully."})
 
+    @action(detail=False, methods=['post'], url_path='bulk-review', permission_classes=[permissions.IsAdminUser])
+    def bulk_review(self, request):
+        serializer = BulkReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        reviewed, skipped = review_applications(
+            serializer.validated_data['ids'], serializer.validated_data['status']
+        )
+        return Response({
+            "status": serializer.validated_data['status'],
+            "reviewed": reviewed,
+            "skipped": skipped,
+        })
 
 
-
-
-class DoctorProfileViewSet(viewsets.ModelViewSet):
+class DoctorProfileViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = DoctorProfile.objects.all()
     serializer_class = DoctorProfileSerializer
+    pagination_class = KeysetPagination
+    # DoctorProfileSerializer nests the doctor's UserSerializer
+    select_related_fields = ('doctor',)
+    # list with ?near= reads candidate coordinates, then the page
+    query_budgets = {'list': 3, 'retrieve': 2}
+    # ?ordering=next_available filters out the NULLs, see get_queryset()
+    keyset_not_null = ('next_available_at',)
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'free_slots']:
             return [AllowAny()]  # Allow all users to view profiles
         return [IsAuthenticated()]  # Require authentication for create/update/delete
 
@@ -138,13 +157,110 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
             if self.request.user.is_authenticated and self.request.user.role != 'doctor':
                 raise PermissionDenied("Only doctors can access their own profiles via 'me'.")
             try:
-                return DoctorProfile.objects.get(doctor=self.request.user)
+                return self.filter_queryset(self.get_queryset()).get(doctor=self.request.user)
             except DoctorProfile.DoesNotExist:
                 raise NotFound("Doctor profile not found.")
         return super().get_object()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        specialization = self.request.query_params.get('specialization')
+        if specialization:
+            queryset = queryset.filter(specialization=specialization)
+
+        # Doctors without an open slot have nothing to sort by and are left
+        # out, so the order is a plain range over the next_available_at indexes
+        if self.request.query_params.get('ordering') == 'next_available':
+            queryset = queryset.filter(next_available_at__isnull=False)
+
+        # ?day=Tuesday&time=10:00 (either or both) filter on AvailabilityWindow rows
+        day = self.request.query_params.get('day')
+        available_at = self.request.query_params.get('time')
+        if day or available_at:
+            windows = AvailabilityWindow.objects.filter(profile=OuterRef('pk'))
+            if day:
+                if day.capitalize() not in DAY_NAMES:
+                    raise ParseError(f"'{day}' is not a valid day of the week.")
+                windows = windows.filter(weekday=DAY_NAMES.index(day.capitalize()))
+            if available_at:
+                try:
+                    minute = parse_hhmm(available_at)
+                except ValueError as e:
+                    raise ParseError(str(e))
+                windows = windows.filter(start_minute__lte=minute, end_minute__gte=minute)
+            queryset = queryset.filter(Exists(windows))
+
+        # ?q= matches every word against the directory search index
+        query = self.request.query_params.get('q')
+        if query:
+            queryset = search_profiles(queryset, query)
+        return queryset
+
+    def get_keyset_ordering(self):
+        # ?near= results are ordered by distance, computed in list()
+        if self.action == 'list' and self.request.query_params.get('near'):
+            return ('distance_km', 'id')
+        # Search results are ranked, best match first
+        if self.action == 'list' and self.request.query_params.get('q'):
+            return ('-search_rank', 'id')
+        # ?ordering=next_available sorts by the denormalized soonest open slot
+        if self.request.query_params.get('ordering') == 'next_available':
+            return ('next_available_at', 'id')
+        return ('created_at', 'id')
+
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)  # Allow all profiles to be listed
+        # Public and identical for every caller, so served from the shared cache
+        if 'near' in request.query_params:
+            compute = partial(self.list_near, request)
+        else:
+            compute = partial(super().list, request, *args, **kwargs)  # Allow all profiles to be listed
+        return cached_response(request, directory_version(), compute)
+
+    def retrieve(self, request, *args, **kwargs):
+        if kwargs.get('pk') == 'me':
+            return super().retrieve(request, *args, **kwargs)
+        compute = partial(super().retrieve, request, *args, **kwargs)
+        return cached_response(request, profile_version(kwargs['pk']), compute)
+
+    def list_near(self, request):
+        """
+        Profiles within ?radius= km (default DEFAULT_RADIUS_KM) of ?near=lat,lng,
+        nearest first, each with its distance_km. Grid cells around the point
+        prune the candidates in the database; exact distances are computed on
+        just their coordinates, and only the page's profiles are loaded.
+        """
+        try:
+            lat, lng = parse_point(request.query_params['near'])
+            radius = float(request.query_params.get('radius', DEFAULT_RADIUS_KM))
+        except ValueError:
+            return Response(
+                {"detail": "'near' must be 'lat,lng' and 'radius' a number of kilometres."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < radius <= MAX_RADIUS_KM:
+            return Response(
+                {"detail": f"'radius' must be between 0 and {MAX_RADIUS_KM} km."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        in_cells = Q()
+        for first, last in cell_ranges(lat, lng, radius):
+            in_cells |= Q(geo_cell__range=(first, last))
+        candidates = queryset.filter(in_cells).values_list('id', 'latitude', 'longitude')
+        found = nearest(candidates, lat, lng, radius)
+
+        page_ids = self.paginator.paginate_sorted([(match, match[1]) for match in found], request, self)
+        distances = {pk: distance for distance, pk in found}
+        profiles = {profile.pk: profile for profile in queryset.filter(pk__in=page_ids)}
+        page_ids = [pk for pk in page_ids if pk in profiles]  # deleted meanwhile
+        data = self.get_serializer([profiles[pk] for pk in page_ids], many=True).data
+        for item, pk in zip(data, page_ids):
+            item['distance_km'] = round(distances[pk], 3)
+        return self.paginator.get_paginated_response(data)
 
     def create(self, request, *args, **kwargs):
         if request.user.role != 'doctor':
@@ -206,3 +322,49 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save(doctor=request.user)
             return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='free-slots')
+    def free_slots(self, request, pk=None):
+        """
+        Open booking slots for a doctor between ?from= and ?to= (YYYY-MM-DD),
+        cut into ?granularity= minute slots. Pending and accepted appointments
+        are subtracted from the doctor's availability.
+        """
+        profile = self.get_object()
+        try:
+            start = date.fromisoformat(request.query_params.get('from', date.today().isoformat()))
+            end = date.fromisoformat(
+                request.query_params.get('to', (start + timedelta(days=FREE_SLOTS_DEFAULT_DAYS - 1)).isoformat())
+            )
+            granularity = int(request.query_params.get('granularity', DEFAULT_SLOT_MINUTES))
+        except ValueError:
+            return Response(
+                {"detail": "'from' and 'to' must be YYYY-MM-DD dates and 'granularity' a number of minutes."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        start = max(start, date.today())
+        if end < start:
+            return Response({"detail": "'to' must not be before 'from'."}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= FREE_SLOTS_MAX_DAYS:
+            return Response(
+                {"detail": f"Date range cannot exceed {FREE_SLOTS_MAX_DAYS} days."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 5 <= granularity <= 240:
+            return Response(
+                {"detail": "'granularity' must be between 5 and 240 minutes."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        booked = profile.get_booked_minutes(start, end)
+        slots = free_slots(profile.get_bookable_index(), start, end, booked, granularity, now=timezone.localtime())
+        return Response({
+            "from": start,
+            "to": end,
+            "granularity": granularity,
+            "slots": [
+                {"date": day, "times": [format_minutes(minute) for minute in starts]}
+                for day, starts in slots
+            ],
+        })
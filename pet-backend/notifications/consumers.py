@@ -1,6 +1,7 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 import logging
+from .dispatch import recipient_group
 
 logger = logging.getLogger(__name__)
 
@@ -9,7 +10,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         user = self.scope['user']
         logger.debug(f"WebSocket connection attempt by user: {user}")
         if user.is_authenticated:
-            self.group_name = f"user_{user.id}"
+            self.group_name = recipient_group(user.id)
             logger.info(f"User {user.id} connected to group {self.group_name}")
             await self.channel_layer.group_add(self.group_name, self.channel_name)
             await self.accept()
@@ -24,4 +25,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def send_notification(self, event):
         logger.debug(f"Sending notification: {event['message']}")
-        await self.send(text_data=json.dumps(event['message']))
\ No newline at end of file
+        await self.send(text_data=json.dumps(event['message']))
+
+    async def send_unread_count(self, event):
+        await self.send(text_data=json.dumps({'type': 'unread_count', **event['message']}))
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from functools import reduce
+from operator import or_
+from django.db.models import Max, Q
+from django.utils import timezone
+from utils.outbox import claim_batch, record_failures
+from .models import NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_BATCH_SIZE = 200
+
+
+def recipient_group(recipient_id):
+    """Channel layer group NotificationConsumer joins for a user."""
+    return f"user_{recipient_id}"
+
+
+def queue_messages(messages, send_at=None, coalesce_key='', event_type='send_notification'):
+    """
+    Queues (recipient_id, message) pairs for WebSocket delivery with one
+    INSERT. Call it inside the transaction that creates the notifications,
+    so a message exists exactly when its rows commit. send_at delays the
+    delivery, e.g. to the end of a coalescing window, and event_type names
+    the NotificationConsumer handler that sends it.
+    """
+    NotificationDelivery.objects.bulk_create([
+        NotificationDelivery(
+            group=recipient_group(recipient_id), message=message, event_type=event_type,
+            coalesce_key=coalesce_key, next_attempt_at=send_at or timezone.now(),
+        )
+        for recipient_id, message in messages
+    ])
+
+
+async def send_all(channel_layer, deliveries):
+    """Sends every (group, event_type, message) concurrently; returns the exception or None for each."""
+    return await asyncio.gather(*[
+        channel_layer.group_send(group, {'type': event_type, 'message': message})
+        for group, event_type, message in deliveries
+    ], return_exceptions=True)
+
+
+def dispatch_batch(channel_layer, batch_size=DISPATCH_BATCH_SIZE, now=None):
+    """
+    Sends one batch of due messages, with the group_send calls pipelined over
+    a single event loop pass, outside any transaction. Sent rows are deleted
+    afterwards, so a crash in between re-sends them: delivery is at-least-once
+    and clients should de-duplicate on the message id.
+
+    Of the messages sharing a coalesce key only the newest in the whole
+    outbox, which carries the totals, is ever sent: older ones are dropped
+    unsent, whichever batch they fall in or however long they were backing
+    off, and sending the newest removes every older one with it.
+
+    Returns (rows claimed, rows sent or collapsed).
+    """
+    now = now or timezone.now()
+    rows = claim_batch(NotificationDelivery, ['coalesce_key', 'group', 'event_type', 'message'], batch_size, now)
+    if not rows:
+        return 0, 0
+
+    keys = {key for _, _, key, *_ in rows if key}
+    newest = dict(
+        NotificationDelivery.objects.filter(coalesce_key__in=keys)
+        .values('coalesce_key').annotate(newest=Max('id')).values_list('coalesce_key', 'newest')
+    ) if keys else {}
+    to_send = [row for row in rows if not row[2] or newest[row[2]] == row[0]]
+    superseded = [row[0] for row in rows if row[2] and newest[row[2]] != row[0]]
+    results = async_to_sync(send_all)(channel_layer, [row[3:] for row in to_send])
+
+    sent, failures = [], []
+    for (pk, attempts, key, *_), error in zip(to_send, results):
+        if error is None:
+            sent.append(Q(coalesce_key=key, pk__lte=pk) if key else Q(pk=pk))
+        else:
+            failures.append((pk, attempts, error))
+
+    if failures:
+        logger.warning("Sending %d notification messages failed, will retry: %s", len(failures), failures[0][2])
+        record_failures(NotificationDelivery, failures, now)
+    NotificationDelivery.objects.filter(reduce(or_, sent, Q(pk__in=superseded))).delete()
+    return len(rows), len(rows) - len(failures)
+
+
+def dispatch_notifications(batch_size=DISPATCH_BATCH_SIZE, now=None):
+    """
+    Drains every due message batch by batch, stopping after a batch with
+    failures so an unreachable channel layer is not hammered. Returns the
+    number of queued messages delivered, collapsed ones included.
+    """
+    channel_layer = get_channel_layer()
+    total = 0
+    while True:
+        claimed, sent = dispatch_batch(channel_layer, batch_size, now)
+        total += sent
+        if claimed < batch_size or sent < claimed:
+            return total
+
+
+def queue_unread_count(recipient_id, count):
+    """Queues the recipient's new unread count; only the latest of a batch is sent."""
+    queue_messages(
+        [(recipient_id, {'unread_count': count})],
+        coalesce_key=f"unread:{recipient_id}",
+        event_type='send_unread_count',
+    )
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from notifications.dispatch import DISPATCH_BATCH_SIZE, dispatch_notifications
+
+class Command(BaseCommand):
+    help = 'Send queued notification messages (the NotificationDelivery outbox) to the WebSocket channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DISPATCH_BATCH_SIZE, help='Messages sent per batch')
+        parser.add_argument('--watch', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds between polls with --watch')
+
+    def handle(self, *args, **options):
+        if not options['watch']:
+            sent = dispatch_notifications(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} notification messages."))
+            return
+
+        self.stdout.write(f"Dispatching notification messages every {options['interval']}s.")
+        while True:
+            sent = dispatch_notifications(options['batch_size'])
+            if sent:
+                self.stdout.write(f"Sent {sent} notification messages.")
+            time.sleep(options['interval'])
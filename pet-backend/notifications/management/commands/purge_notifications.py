@@ -0,0 +1,37 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notifications.retention import RETENTION_CHUNK_SIZE, RetentionPolicy, purge
+
+class Command(BaseCommand):
+    help = 'Delete notifications past the retention policy in small primary-key ranges (run daily, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-read', type=int, default=settings.NOTIFICATION_KEEP_READ,
+            help='Newest read notifications kept per user; -1 keeps them all'
+        )
+        parser.add_argument(
+            '--max-age-days', type=int, default=settings.NOTIFICATION_MAX_AGE_DAYS,
+            help='Delete notifications older than this, read or not; 0 turns it off'
+        )
+        parser.add_argument('--chunk-size', type=int, default=RETENTION_CHUNK_SIZE, help='Ids scanned per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between chunks')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint of an interrupted run')
+
+    def handle(self, *args, **options):
+        policy = RetentionPolicy(
+            keep_read=options['keep_read'] if options['keep_read'] >= 0 else None,
+            max_age_days=options['max_age_days'] or None,
+        )
+        rows = reclaimed = 0
+        for deleted, size in purge(policy, options['chunk_size'], resume=not options['restart']):
+            rows += deleted
+            reclaimed += size
+            if deleted:
+                self.stdout.write(f"Deleted {rows} notifications so far...")
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {rows} notifications, reclaiming about {reclaimed} bytes."
+        ))
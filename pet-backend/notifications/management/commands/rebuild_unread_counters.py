@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from notifications.models import Notification, UnreadCounter
+
+class Command(BaseCommand):
+    help = 'Recompute every UnreadCounter from the unread rows of the notifications table'
+
+    def handle(self, *args, **kwargs):
+        counts = (
+            Notification.objects.filter(is_read=False)
+            .values_list('recipient_id').annotate(total=Count('id')).order_by()
+        )
+        with transaction.atomic():
+            UnreadCounter.objects.all().delete()
+            UnreadCounter.objects.bulk_create([
+                UnreadCounter(user_id=user_id, count=total) for user_id, total in counts.iterator()
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt unread counters for {len(counts)} users."))
@@ -1,17 +1,129 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth import get_user_model
-from appointments.models import Appointment
+from appointments.models import Appointment, ArchivedAppointment
+from utils.outbox import OutboxEntry
 
 User = get_user_model()
 
+
+def cascade_unless_coalesced(collector, field, sub_objs, using):
+    """
+    on_delete for Notification.appointment: a notification of one event goes
+    with its appointment, a coalesced one only loses the reference here and
+    the rest of the appointment in notifications.signals.drop_deleted_appointment.
+    """
+    single = [notification for notification in sub_objs if notification.count <= 1]
+    coalesced = [notification for notification in sub_objs if notification.count > 1]
+    if single:
+        models.CASCADE(collector, field, single, using)
+    if coalesced:
+        collector.add_field_update(field, None, coalesced)
+
+
 class Notification(models.Model):
-    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    # The first appointment the notification is about. Deleting it deletes the
+    # notification, except that a coalesced row moves on to its next appointment
+    appointment = models.ForeignKey(
+        Appointment, on_delete=cascade_unless_coalesced, null=True, blank=True, related_name='notifications'
+    )
+    # Set instead of appointment once the appointment is moved to the archive
+    archived_appointment = models.ForeignKey(
+        ArchivedAppointment, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications'
+    )
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     verb = models.CharField(max_length=255) 
     actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     target = models.CharField(max_length=255, null=True, blank=True)
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Events merged into this row by the coalescing window (NOTIFICATION_COALESCE_SECONDS),
+    # and the appointments they were about; archived appointments keep their ids
+    count = models.PositiveIntegerField(default=1)
+    appointment_ids = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            # Notification list, newest first, paginated on (timestamp, id)
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='notif_recipient_ts_idx'),
+            # Unread lookups only touch the unread rows
+            models.Index(
+                fields=['recipient', '-timestamp'],
+                condition=models.Q(is_read=False),
+                name='notif_unread_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.actor} {self.verb} appointment for {self.target}"
+
+
+class UnreadCounter(models.Model):
+    """
+    Each user's number of unread notifications, kept in step with the
+    Notification rows in the same transactions so the badge is a single
+    primary-key read. Created from a COUNT the first time it is needed.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.count}"
+
+    @classmethod
+    def initialize(cls, user_id):
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        counter, _ = cls.objects.get_or_create(user_id=user_id, defaults={'count': count})
+        return counter.count
+
+    @classmethod
+    def get(cls, user_id):
+        count = cls.objects.filter(user_id=user_id).values_list('count', flat=True).first()
+        return cls.initialize(user_id) if count is None else count
+
+    @classmethod
+    def add(cls, user_id, delta):
+        """
+        Applies delta with an F() update and returns the new count. Call it in
+        the transaction that changed the rows: a counter created here counts
+        them already.
+        """
+        if not cls.objects.filter(user_id=user_id).update(count=F('count') + delta):
+            return cls.initialize(user_id)
+        return cls.objects.filter(user_id=user_id).values_list('count', flat=True).get()
+
+
+class RetentionCheckpoint(models.Model):
+    """
+    Where an interrupted purge_notifications run resumes: the first id of its
+    next chunk, and the policy it ran with, as RetentionPolicy.settings().
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_id = models.BigIntegerField()
+    policy = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
+
+
+class NotificationDelivery(OutboxEntry):
+    """
+    Outbox of WebSocket messages, queued in the transaction that creates the
+    notifications and sent to the channel layer group by
+    notifications.dispatch.dispatch_notifications after commit.
+    """
+    group = models.CharField(max_length=100)
+    message = models.JSONField()
+    # Consumer handler the message is sent to
+    event_type = models.CharField(max_length=50, default='send_notification')
+    # Messages sharing a key are collapsed into the newest one when sent together
+    coalesce_key = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='notif_delivery_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.group}: {self.message.get('verb')}"
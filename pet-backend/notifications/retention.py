@@ -0,0 +1,130 @@
+import json
+from collections import Counter
+from contextvars import ContextVar
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+from .dispatch import queue_unread_count
+from .models import Notification, RetentionCheckpoint, UnreadCounter
+
+RETENTION_CHUNK_SIZE = 1000
+CHECKPOINT_NAME = 'purge_notifications'
+# Rough fixed cost of a row besides its text: tuple header, keys, timestamp,
+# flags and its entries in the recipient indexes
+ROW_OVERHEAD_BYTES = 120
+# True while purge_chunk deletes a chunk; see notifications.signals
+purging = ContextVar('purging', default=False)
+
+
+class RetentionPolicy:
+    """
+    Which notifications to keep: every unread row plus each user's keep_read
+    newest read rows (None keeps them all), and nothing, read or not, older
+    than max_age_days (None for no age limit).
+    """
+
+    def __init__(self, keep_read=None, max_age_days=None, now=None):
+        self.keep_read = keep_read
+        self.max_age_days = max_age_days
+        self.cutoff = (now or timezone.now()) - timedelta(days=max_age_days) if max_age_days else None
+        # Per recipient, (timestamp, id) of the newest read row past keep_read, or None
+        self.read_cutoffs = {}
+
+    def settings(self):
+        """The options the policy was built from, as saved with a purge checkpoint."""
+        return {'keep_read': self.keep_read, 'max_age_days': self.max_age_days}
+
+    def load_read_cutoffs(self, recipient_ids):
+        """
+        Finds the newest read row each recipient does not keep, one indexed
+        query per recipient, cached for the run: rows only get older, so a
+        cached cutoff never deletes a row the policy would keep.
+        """
+        for recipient_id in set(recipient_ids) - self.read_cutoffs.keys():
+            self.read_cutoffs[recipient_id] = (
+                Notification.objects.filter(recipient_id=recipient_id, is_read=True)
+                .order_by('-timestamp', '-id')
+                .values_list('timestamp', 'id')[self.keep_read:self.keep_read + 1]
+                .first()
+            )
+
+    def doomed(self, rows):
+        """The (id, recipient_id, timestamp, is_read) rows the policy drops."""
+        if self.keep_read is not None:
+            self.load_read_cutoffs(recipient_id for _, recipient_id, _, is_read in rows if is_read)
+        for row in rows:
+            pk, recipient_id, timestamp, is_read = row
+            if self.cutoff and timestamp < self.cutoff:
+                yield row
+            elif is_read and self.keep_read is not None:
+                read_cutoff = self.read_cutoffs.get(recipient_id)
+                if read_cutoff and (timestamp, pk) <= read_cutoff:
+                    yield row
+
+
+def estimated_bytes(pks):
+    """Approximate storage of the rows: their text columns plus ROW_OVERHEAD_BYTES each."""
+    total = 0
+    for verb, target, appointment_ids in Notification.objects.filter(pk__in=pks).values_list(
+        'verb', 'target', 'appointment_ids'
+    ):
+        total += ROW_OVERHEAD_BYTES + len(verb.encode()) + len((target or '').encode())
+        total += len(json.dumps(appointment_ids))
+    return total
+
+
+def purge_chunk(policy, first_id, last_id):
+    """
+    Deletes the rows with first_id <= id < last_id that the policy drops, in
+    one short transaction, and moves the unread counters of any unread rows
+    deleted. Returns (rows deleted, estimated bytes reclaimed).
+    """
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.filter(pk__gte=first_id, pk__lt=last_id)
+            .values_list('id', 'recipient_id', 'timestamp', 'is_read')
+        )
+        doomed = list(policy.doomed(rows))
+        if not doomed:
+            return 0, 0
+
+        pks = [row[0] for row in doomed]
+        reclaimed = estimated_bytes(pks)
+        # The post_delete receiver skips these rows; each counter moves once below
+        token = purging.set(True)
+        try:
+            Notification.objects.filter(pk__in=pks).delete()
+        finally:
+            purging.reset(token)
+        unread = Counter(recipient_id for _, recipient_id, _, is_read in doomed if not is_read)
+        for recipient_id, count in unread.items():
+            if UnreadCounter.objects.filter(user_id=recipient_id).update(count=F('count') - count):
+                queue_unread_count(recipient_id, UnreadCounter.get(recipient_id))
+    return len(pks), reclaimed
+
+
+def purge(policy, chunk_size=RETENTION_CHUNK_SIZE, resume=True):
+    """
+    Walks the table in primary-key ranges of chunk_size, one transaction per
+    range, so locks are only ever held briefly. Progress is saved to a
+    RetentionCheckpoint row after every chunk; with resume an interrupted
+    run, even in another process, continues where it stopped, unless it ran
+    with a different policy: the ids it skipped were only checked against
+    its own. Yields (rows, bytes) per chunk.
+    """
+    bounds = Notification.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    start = bounds['first']
+    checkpoint = RetentionCheckpoint.objects.filter(name=CHECKPOINT_NAME).first()
+    if resume and checkpoint and checkpoint.policy == policy.settings():
+        start = max(start, checkpoint.next_id)
+
+    for first_id in range(start, bounds['last'] + 1, chunk_size):
+        result = purge_chunk(policy, first_id, first_id + chunk_size)
+        RetentionCheckpoint.objects.update_or_create(
+            name=CHECKPOINT_NAME, defaults={'next_id': first_id + chunk_size, 'policy': policy.settings()}
+        )
+        yield result
+    RetentionCheckpoint.objects.filter(name=CHECKPOINT_NAME).delete()
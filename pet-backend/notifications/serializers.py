@@ -6,4 +6,14 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
-        fields = ['id', 'verb', 'actor', 'target', 'is_read', 'timestamp']
+        fields = ['id', 'verb', 'actor', 'target', 'is_read', 'timestamp', 'count', 'appointment_ids']
+
+
+class MarkReadSerializer(serializers.Serializer):
+    MAX_ITEMS = 100
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_ITEMS
+    )
@@ -0,0 +1,52 @@
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from appointments.archive import archiving
+from appointments.models import Appointment
+from .dispatch import queue_unread_count
+from .models import Notification, UnreadCounter
+from .retention import purging
+from .utils import coalesced_target
+
+@receiver(post_delete, sender=Notification)
+def update_unread_counter_on_delete(sender, instance, **kwargs):
+    # Notifications also go when their recipient is deleted; purge_chunk moves
+    # the counters once per recipient itself
+    if instance.is_read or purging.get():
+        return
+    counter = UnreadCounter.objects.filter(user_id=instance.recipient_id)
+    if counter.update(count=F('count') - 1):
+        queue_unread_count(instance.recipient_id, UnreadCounter.get(instance.recipient_id))
+
+
+@receiver(post_delete, sender=Appointment)
+def drop_deleted_appointment(sender, instance, **kwargs):
+    """
+    Takes a deleted appointment out of the coalesced notifications that
+    cover it (single-event ones went with it, see cascade_unless_coalesced):
+    each loses one from count, is deleted when nothing is left, and otherwise
+    points its FK at its next appointment that still exists.
+    """
+    # Archived appointments keep their ids in appointment_ids
+    if archiving.get():
+        return
+    # Notifications about the appointment are as old as it at most, so this
+    # reads a recent slice of two users' rows through notif_recipient_ts_idx
+    coalesced = Notification.objects.filter(
+        recipient_id__in=[instance.user_id, instance.doctor_id], count__gt=1, timestamp__gte=instance.created_at
+    )
+    for notification in coalesced:
+        if instance.id not in notification.appointment_ids:
+            continue
+        notification.appointment_ids = [pk for pk in notification.appointment_ids if pk != instance.id]
+        notification.count -= 1
+        if notification.appointment_id is None:
+            # Appointments deleted in the same query are gone already
+            notification.appointment_id = Appointment.objects.filter(
+                pk__in=notification.appointment_ids
+            ).order_by('pk').values_list('pk', flat=True).first()
+        if notification.count:
+            notification.target = coalesced_target(notification.verb, notification.count)
+            notification.save(update_fields=['appointment', 'appointment_ids', 'count', 'target'])
+        else:
+            notification.delete()
@@ -1,3 +1,410 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from appointments.models import Appointment
+from appointments.serializers import AppointmentSerializer
+from notifications.dispatch import dispatch_notifications, queue_unread_count
+from notifications.models import Notification, NotificationDelivery, RetentionCheckpoint, UnreadCounter
+from notifications.retention import CHECKPOINT_NAME, RetentionPolicy, purge
+from notifications.utils import create_notification, create_notifications_bulk
+from pets.models import Pet
+from utils.outbox import retry_delay
 
-# Create your tests here.
+User = get_user_model()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificationTestCase(TestCase):
+    """A doctor and a pet owner for the notifications under test."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(
+            email="doc@example.com", firstname="Doc", lastname="Tor", password="pass12345", role="doctor"
+        )
+        self.owner = User.objects.create_user(
+            email="owner@example.com", firstname="Pat", lastname="Owner", password="pass12345"
+        )
+
+
+class NotificationOutboxTests(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.channel_layer = get_channel_layer()
+        async_to_sync(self.channel_layer.group_add)(f"user_{self.doctor.id}", "doctor-channel")
+
+    def notify(self, target="for Bella"):
+        return create_notification(recipient=self.doctor, verb="booked an appointment", actor=self.owner, target=target)
+
+    def test_message_is_queued_with_the_notification_and_sent_by_the_dispatcher(self):
+        with mock.patch.object(type(self.channel_layer), 'group_send') as group_send:
+            notification = self.notify()
+        group_send.assert_not_called()
+        self.assertEqual(NotificationDelivery.objects.filter(event_type='send_notification').count(), 1)
+
+        # The notification and the new unread count
+        self.assertEqual(dispatch_notifications(), 2)
+        message = async_to_sync(self.channel_layer.receive)("doctor-channel")
+        self.assertEqual(message['message']['id'], notification.id)
+        self.assertEqual(message['message']['target'], "for Bella")
+        self.assertFalse(NotificationDelivery.objects.exists())
+
+    def test_rolled_back_notifications_are_never_sent(self):
+        try:
+            with transaction.atomic():
+                self.notify()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationDelivery.objects.exists())
+        self.assertEqual(dispatch_notifications(), 0)
+
+    def test_batches_are_drained_and_failures_retried(self):
+        for i in range(5):
+            self.notify(target=f"visit {i}")
+        # Only the notification frames matter here
+        NotificationDelivery.objects.filter(event_type='send_unread_count').delete()
+        now = timezone.now()
+
+        real_send = self.channel_layer.group_send
+        calls = []
+        async def flaky_send(group, event):
+            calls.append(event['message']['target'])
+            if event['message']['target'] == "visit 3":
+                raise ConnectionError("Redis unavailable")
+            await real_send(group, event)
+
+        with mock.patch.object(self.channel_layer, 'group_send', flaky_send):
+            # The second batch has a failure, so the third is left for the next run
+            self.assertEqual(dispatch_notifications(batch_size=2, now=now), 3)
+        self.assertEqual(calls, ["visit 0", "visit 1", "visit 2", "visit 3"])
+
+        pending = NotificationDelivery.objects.order_by('id')
+        self.assertEqual([delivery.message['target'] for delivery in pending], ["visit 3", "visit 4"])
+        failed = pending[0]
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(failed.next_attempt_at, now + retry_delay(1))
+        self.assertIn("Redis unavailable", failed.last_error)
+
+        self.assertEqual(dispatch_notifications(now=now + retry_delay(1)), 2)
+        targets = [async_to_sync(self.channel_layer.receive)("doctor-channel")['message']['target'] for _ in range(5)]
+        self.assertEqual(targets, ["visit 0", "visit 1", "visit 2", "visit 4", "visit 3"])
+
+
+@override_settings(NOTIFICATION_COALESCE_SECONDS=60)
+class NotificationCoalescingTests(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owners = [
+            self.owner,
+            User.objects.create_user(email="owner1@example.com", firstname="Pat", lastname="1", password="pass12345"),
+        ]
+        # Created without signals, so the only notifications are the ones under test
+        self.appointments = Appointment.objects.bulk_create([
+            Appointment(user=self.owners[0], doctor=self.doctor, date=date.today(), time=time(9 + i, 0))
+            for i in range(6)
+        ])
+        self.channel_layer = get_channel_layer()
+        async_to_sync(self.channel_layer.group_add)(f"user_{self.doctor.id}", "doctor-channel")
+
+    def book(self, owner, index):
+        appointment = self.appointments[index]
+        return create_notification(
+            recipient=self.doctor, verb="booked an appointment", actor=owner,
+            target="for Bella", appointment=appointment
+        )
+
+    def test_events_within_the_window_share_one_row_and_one_frame(self):
+        first = self.book(self.owners[0], 0)
+        for index in range(1, 5):
+            self.book(self.owners[index % 2], index)
+        create_notification(recipient=self.doctor, verb="cancelled an appointment", actor=self.owners[0], target="x")
+
+        self.assertEqual(Notification.objects.filter(recipient=self.doctor).count(), 2)
+        first.refresh_from_db()
+        self.assertEqual(first.count, 5)
+        self.assertEqual(first.appointment_ids, [appointment.id for appointment in self.appointments[:5]])
+        self.assertEqual(first.appointment_id, self.appointments[0].id)
+        self.assertEqual(first.target, "5 new appointment requests")
+        self.assertIsNone(first.actor)
+
+        # Only the unread count goes out before the window closes
+        self.assertEqual(dispatch_notifications(), 2)
+        self.assertEqual(async_to_sync(self.channel_layer.receive)("doctor-channel")['message'], {'unread_count': 2})
+        self.assertEqual(dispatch_notifications(now=timezone.now() + timedelta(seconds=60)), 6)
+        frames = [async_to_sync(self.channel_layer.receive)("doctor-channel")['message'] for _ in range(2)]
+        self.assertEqual(
+            sorted((frame['verb'], frame['count']) for frame in frames),
+            [("booked an appointment", 5), ("cancelled an appointment", 1)]
+        )
+        self.assertFalse(NotificationDelivery.objects.exists())
+
+    def test_coalesced_row_outlives_its_first_appointment(self):
+        first = self.book(self.owners[0], 0)
+        self.book(self.owners[0], 1)
+        self.appointments[0].delete()
+        first.refresh_from_db()
+        self.assertEqual(first.appointment, self.appointments[1])
+        self.assertEqual((first.count, first.appointment_ids), (1, [self.appointments[1].id]))
+
+        self.appointments[1].delete()
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(UnreadCounter.get(self.doctor.id), 0)
+
+    def test_deleting_several_appointments_at_once_keeps_the_fk_valid(self):
+        first = self.book(self.owners[0], 0)
+        for index in (1, 2):
+            self.book(self.owners[0], index)
+        Appointment.objects.filter(pk__in=[self.appointments[0].pk, self.appointments[1].pk]).delete()
+        first.refresh_from_db()
+        self.assertEqual((first.appointment, first.count), (self.appointments[2], 1))
+
+    def test_read_or_expired_windows_start_a_new_notification(self):
+        first = self.book(self.owners[0], 1)
+        Notification.objects.filter(pk=first.pk).update(is_read=True)
+        second = self.book(self.owners[0], 2)
+        self.assertNotEqual(first.pk, second.pk)
+
+        Notification.objects.filter(pk=second.pk).update(timestamp=timezone.now() - timedelta(seconds=61))
+        third = self.book(self.owners[0], 3)
+        self.assertNotEqual(second.pk, third.pk)
+        self.assertEqual(third.count, 1)
+
+    @override_settings(NOTIFICATION_COALESCE_SECONDS=0)
+    def test_window_is_off_by_default(self):
+        self.book(self.owners[0], 1)
+        self.book(self.owners[0], 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        # Two notifications and two unread counts, all due at once
+        self.assertEqual(dispatch_notifications(), 4)
+
+
+class UnreadCounterTests(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def notify(self, count=1):
+        return [
+            create_notification(recipient=self.doctor, verb="booked an appointment", actor=self.owner, target="x")
+            for _ in range(count)
+        ]
+
+    def unread_count(self):
+        response = self.client.get('/api/notifications/unread-count/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['unread_count']
+
+    def test_count_is_a_single_primary_key_read(self):
+        self.notify(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.unread_count(), 3)
+
+    def test_counter_follows_mark_read_and_mark_all_read(self):
+        first, *_ = self.notify(3)
+        self.client.patch(f'/api/notifications/{first.id}/mark-read/')
+        self.client.patch(f'/api/notifications/{first.id}/mark-read/')
+        self.assertEqual(self.unread_count(), 2)
+        self.client.post('/api/notifications/mark-all-read/')
+        self.assertEqual(self.unread_count(), 0)
+        self.notify()
+        self.assertEqual(self.unread_count(), 1)
+        Notification.objects.filter(recipient=self.doctor, is_read=False).delete()
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_cancelling_a_booking_removes_its_notification(self):
+        appointment = Appointment.objects.create(
+            user=self.owner, doctor=self.doctor, date=date.today() + timedelta(days=1), time=time(9, 0)
+        )
+        self.assertEqual(self.unread_count(), 1)
+
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.delete(f'/api/appointments/{appointment.id}/').status_code, 204)
+        self.client.force_authenticate(self.doctor)
+        self.assertFalse(Notification.objects.filter(recipient=self.doctor).exists())
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_counter_is_created_from_existing_rows_and_rebuilt(self):
+        Notification.objects.bulk_create([
+            Notification(recipient=self.doctor, verb="booked an appointment", target="x") for _ in range(2)
+        ])
+        self.assertFalse(UnreadCounter.objects.exists())
+        self.assertEqual(self.unread_count(), 2)
+
+        UnreadCounter.objects.filter(user=self.doctor).update(count=40)
+        call_command('rebuild_unread_counters', stdout=StringIO())
+        self.assertEqual(self.unread_count(), 2)
+
+    def test_counts_split_across_batches_are_sent_once(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(f"user_{self.doctor.id}", "doctor-channel")
+        for count in (1, 2, 3):
+            queue_unread_count(self.doctor.id, count)
+        now = timezone.now()
+        # The first is backing off from a failed send and comes due after the newest went out
+        stale = NotificationDelivery.objects.order_by('id').first()
+        NotificationDelivery.objects.filter(pk=stale.pk).update(next_attempt_at=now + timedelta(seconds=1))
+
+        self.assertEqual(dispatch_notifications(batch_size=1, now=now), 2)
+        self.assertEqual(async_to_sync(channel_layer.receive)("doctor-channel")['message'], {'unread_count': 3})
+        self.assertFalse(NotificationDelivery.objects.exists())
+        self.assertEqual(dispatch_notifications(now=now + timedelta(seconds=1)), 0)
+
+    def test_changes_are_pushed_with_only_the_latest_count(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(f"user_{self.doctor.id}", "doctor-channel")
+        self.notify(2)
+        self.client.post('/api/notifications/mark-all-read/')
+        dispatch_notifications()
+
+        frames = []
+        for _ in range(3):
+            event = async_to_sync(channel_layer.receive)("doctor-channel")
+            frames.append((event['type'], event['message'].get('unread_count')))
+        self.assertEqual(frames, [('send_notification', None), ('send_notification', None), ('send_unread_count', 0)])
+
+
+class BulkMarkReadTests(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        pet = Pet.objects.create(owner=self.owner, name="Bella", species="dog", age=2)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(user=self.owner, doctor=self.doctor, pet=pet, date=date.today(), time=time(9 + i, 0))
+            for i in range(15)
+        ])
+        self.notifications = create_notifications_bulk(
+            recipient=self.doctor, verb="booked an appointment", actor=self.owner,
+            items=[(appointment, appointment.booking_target()) for appointment in appointments]
+        )
+        self.other = create_notification(recipient=self.owner, verb="accepted your appointment", actor=self.doctor, target="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def test_marks_a_panel_in_one_update_and_one_select(self):
+        ids = [notification.id for notification in self.notifications] + [self.other.id]
+        # Savepoint, UPDATE, counter update and read, unread-count push, release,
+        # then the notifications and their appointments
+        with self.assertNumQueries(8):
+            response = self.client.patch('/api/notifications/mark-read/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['marked'], 15)
+        self.assertEqual(len(response.data['notifications']), 15)
+        self.assertFalse(Notification.objects.filter(recipient=self.doctor, is_read=False).exists())
+        self.assertFalse(Notification.objects.get(pk=self.other.pk).is_read)
+        self.assertEqual(UnreadCounter.get(self.doctor.id), 0)
+
+        latest = response.data['notifications'][0]
+        self.assertTrue(latest['is_read'])
+        appointment = Notification.objects.get(pk=latest['id']).appointment
+        self.assertEqual(latest['appointment'], AppointmentSerializer(appointment).data)
+
+        response = self.client.patch('/api/notifications/mark-read/', {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.data['marked'], 0)
+        self.assertEqual(len(response.data['notifications']), 2)
+
+    def test_notifications_from_the_booking_signal_carry_their_appointment(self):
+        pet = Pet.objects.get(owner=self.owner)
+        appointment = Appointment.objects.create(
+            user=self.owner, doctor=self.doctor, pet=pet, date=date.today(), time=time(8, 0)
+        )
+        booked = Notification.objects.get(recipient=self.doctor, appointment_ids=[appointment.id])
+        expected = AppointmentSerializer(appointment).data
+
+        response = self.client.patch('/api/notifications/mark-read/', {'ids': [booked.id]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        [data] = response.data['notifications']
+        self.assertEqual(data['appointment'], expected)
+        self.assertEqual(data['appointments'], [expected])
+
+        response = self.client.patch(f'/api/notifications/{booked.id}/mark-read/')
+        self.assertEqual(response.data['appointment'], expected)
+
+    def test_ids_are_validated(self):
+        for payload in ({}, {'ids': []}, {'ids': ['a']}, {'ids': list(range(1, 102))}):
+            response = self.client.patch('/api/notifications/mark-read/', payload, format='json')
+            self.assertEqual(response.status_code, 400, payload)
+
+
+class NotificationRetentionTests(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.read = {self.doctor: [], self.owner: []}
+        for i in range(8):
+            recipient = self.doctor if i % 2 else self.owner
+            notification = create_notification(recipient=recipient, verb="booked an appointment", actor=None, target=f"n{i}")
+            Notification.objects.filter(pk=notification.pk).update(timestamp=now - timedelta(days=10 - i))
+            self.read[recipient].append(notification.pk)
+        self.unread = create_notification(recipient=self.doctor, verb="booked an appointment", actor=None, target="unread")
+        Notification.objects.exclude(pk=self.unread.pk).update(is_read=True)
+        call_command('rebuild_unread_counters', stdout=StringIO())
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command('purge_notifications', '--chunk-size', '3', *args, stdout=out)
+        return out.getvalue()
+
+    def remaining(self, recipient):
+        return list(Notification.objects.filter(recipient=recipient).order_by('id').values_list('id', flat=True))
+
+    def test_keeps_unread_and_the_newest_read_rows_per_user(self):
+        output = self.purge('--keep-read', '2')
+        self.assertEqual(self.remaining(self.doctor), self.read[self.doctor][-2:] + [self.unread.pk])
+        self.assertEqual(self.remaining(self.owner), self.read[self.owner][-2:])
+        self.assertIn("Deleted 4 notifications, reclaiming about", output)
+        self.assertNotIn("about 0 bytes", output)
+
+    def test_age_limit_drops_old_rows_and_moves_unread_counters(self):
+        Notification.objects.filter(pk=self.unread.pk).update(timestamp=timezone.now() - timedelta(days=30))
+        self.assertEqual(UnreadCounter.get(self.doctor.id), 1)
+        self.purge('--keep-read', '-1', '--max-age-days', '7')
+        # Rows stamped 10, 9, 8 and 7 days ago, and the old unread one
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertFalse(Notification.objects.filter(pk=self.unread.pk).exists())
+        self.assertEqual(UnreadCounter.get(self.doctor.id), 0)
+
+    def test_interrupted_runs_resume_from_the_checkpoint(self):
+        ids = sorted(self.read[self.doctor] + self.read[self.owner])
+        # A run stopped after its first chunk leaves the next id in the database
+        chunks = purge(RetentionPolicy(keep_read=0), chunk_size=3, resume=False)
+        self.assertEqual(next(chunks)[0], 3)
+        chunks.close()
+        self.assertEqual(RetentionCheckpoint.objects.get(name=CHECKPOINT_NAME).next_id, ids[0] + 3)
+
+        self.assertEqual(
+            RetentionCheckpoint.objects.get(name=CHECKPOINT_NAME).policy, {'keep_read': 0, 'max_age_days': None}
+        )
+
+        RetentionCheckpoint.objects.filter(name=CHECKPOINT_NAME).update(next_id=ids[6])
+        self.purge('--keep-read', '0', '--max-age-days', '0')
+        # Only the chunks from the checkpoint on were scanned, and the checkpoint is cleared
+        self.assertEqual(
+            list(Notification.objects.filter(is_read=True).order_by('id').values_list('id', flat=True)), ids[3:6]
+        )
+        self.assertFalse(RetentionCheckpoint.objects.exists())
+
+        RetentionCheckpoint.objects.create(
+            name=CHECKPOINT_NAME, next_id=ids[6], policy={'keep_read': 0, 'max_age_days': None}
+        )
+        self.purge('--keep-read', '0', '--max-age-days', '0', '--restart')
+        self.assertFalse(Notification.objects.filter(is_read=True).exists())
+        self.assertTrue(Notification.objects.filter(pk=self.unread.pk).exists())
+
+    def test_checkpoint_of_a_run_with_another_policy_is_ignored(self):
+        ids = sorted(self.read[self.doctor] + self.read[self.owner])
+        # A --keep-read 4 run stopped part way; its skipped ids kept rows this run drops
+        RetentionCheckpoint.objects.create(
+            name=CHECKPOINT_NAME, next_id=ids[6], policy={'keep_read': 4, 'max_age_days': None}
+        )
+        self.purge('--keep-read', '0', '--max-age-days', '0')
+        self.assertFalse(Notification.objects.filter(is_read=True).exists())
+        self.assertFalse(RetentionCheckpoint.objects.exists())
@@ -1,9 +1,13 @@
 from django.urls import path
-from .views import NotificationListView, NotificationMarkReadView, MarkAllNotificationsReadView
+from .views import (
+    BulkMarkReadView, NotificationListView, NotificationMarkReadView, MarkAllNotificationsReadView, UnreadCountView,
+)
 
 urlpatterns = [
     path('notifications/', NotificationListView.as_view(), name='notifications'),
     path('notifications/<int:pk>/mark-read/', NotificationMarkReadView.as_view(), name='notification-mark-read'),
+    path('notifications/mark-read/', BulkMarkReadView.as_view(), name='notifications-mark-read'),
     path('notifications/mark-all-read/', MarkAllNotificationsReadView.as_view(), name='mark-all-notifications-read'),
+    path('notifications/unread-count/', UnreadCountView.as_view(), name='notification-unread-count'),
 
 ]
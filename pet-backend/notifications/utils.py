@@ -1,27 +1,113 @@
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Notification
-
-def create_notification(recipient, verb, actor, target):
-    notification = Notification.objects.create(
-        recipient=recipient,
-        verb=verb,
-        actor=actor,
-        target=target
-    )
-
-    # Send via WebSocket to the recipient's group
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"user_{recipient.id}",  # Group name
-        {
-            'type': 'send_notification',
-            'message': {
-                'id': notification.id,
-                'verb': verb,
-                'actor': str(actor),
-                'target': target,
-                'timestamp': str(notification.timestamp)
-            }
-        }
-    )
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .dispatch import queue_messages, queue_unread_count
+from .models import Notification, UnreadCounter
+
+# How a coalesced notification sums up its events, by verb: "5 new appointment requests"
+COALESCED_LABELS = {
+    'booked an appointment': 'new appointment requests',
+}
+
+
+def coalesced_target(verb, count):
+    return f"{count} {COALESCED_LABELS.get(verb, 'updates')}"
+
+
+def notification_message(notification):
+    """WebSocket payload for a notification."""
+    return {
+        'id': notification.id,
+        'verb': notification.verb,
+        'actor': str(notification.actor) if notification.actor_id else None,
+        'target': notification.target,
+        'timestamp': str(notification.timestamp),
+        'count': notification.count,
+        'appointments': notification.appointment_ids,
+    }
+
+
+def create_notification(recipient, verb, actor, target, appointment=None):
+    """
+    Creates a notification and queues its WebSocket message and the
+    recipient's new unread count in the same transaction; the dispatcher
+    sends them after commit.
+
+    With NOTIFICATION_COALESCE_SECONDS set, an unread notification of the
+    same verb to the same recipient created within that window absorbs the
+    event instead: its count and appointments grow, its target becomes a
+    summary, and its message is sent once when the window closes.
+    """
+    window = settings.NOTIFICATION_COALESCE_SECONDS
+    with transaction.atomic():
+        if window:
+            now = timezone.now()
+            notification = Notification.objects.select_for_update().filter(
+                recipient=recipient, verb=verb, is_read=False, timestamp__gte=now - timedelta(seconds=window)
+            ).order_by('-timestamp', '-id').first()
+            if notification:
+                notification.count += 1
+                if appointment:
+                    notification.appointment_ids = notification.appointment_ids + [appointment.id]
+                    if notification.appointment_id is None:
+                        notification.appointment = appointment
+                if notification.actor_id != getattr(actor, 'pk', None):
+                    # Several people: the summary speaks for them
+                    notification.actor = None
+                notification.target = coalesced_target(verb, notification.count)
+                notification.save(update_fields=['count', 'appointment', 'appointment_ids', 'actor', 'target'])
+                queue_messages(
+                    [(recipient.id, notification_message(notification))],
+                    send_at=notification.timestamp + timedelta(seconds=window),
+                    coalesce_key=f"notification:{notification.id}",
+                )
+                return notification
+
+        notification = Notification.objects.create(
+            recipient=recipient,
+            verb=verb,
+            actor=actor,
+            target=target,
+            # As in create_notifications_bulk: the FK names the first appointment,
+            # appointment_ids every one a coalesced row covers
+            appointment=appointment,
+            appointment_ids=[appointment.id] if appointment else [],
+        )
+        queue_messages(
+            [(recipient.id, notification_message(notification))],
+            send_at=notification.timestamp + timedelta(seconds=window) if window else None,
+            coalesce_key=f"notification:{notification.id}" if window else '',
+        )
+        queue_unread_count(recipient.id, UnreadCounter.add(recipient.id, 1))
+    return notification
+
+
+def create_notifications_bulk(recipient, verb, actor, items):
+    """
+    Creates one notification per (appointment, target) pair with a single
+    INSERT and queues one coalesced WebSocket message for the recipient.
+    """
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                recipient=recipient, verb=verb, actor=actor, target=target,
+                appointment=appointment, appointment_ids=[appointment.id],
+            )
+            for appointment, target in items
+        ])
+        if not notifications:
+            return notifications
+
+        latest = notifications[-1]
+        queue_messages([(recipient.id, {
+            'id': latest.id,
+            'verb': verb,
+            'actor': str(actor),
+            'target': latest.target,
+            'timestamp': str(latest.timestamp),
+            'count': len(notifications),
+            'ids': [notification.id for notification in notifications],
+        })])
+        queue_unread_count(recipient.id, UnreadCounter.add(recipient.id, len(notifications)))
+    return notifications
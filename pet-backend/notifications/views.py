@@ -1,42 +1,98 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Notification
-from .serializers import NotificationSerializer
-from appointments.serializers import AppointmentSerializer
+from django.db import transaction
+from .dispatch import queue_unread_count
+from .models import Notification, UnreadCounter
+from .serializers import MarkReadSerializer, NotificationSerializer
+from appointments.models import Appointment
+from appointments.serializers import AppointmentReadSerializer, AppointmentSerializer
+from utils.pagination import KeysetPagination
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
+        # NotificationSerializer renders the actor with str()
         return Notification.objects.filter(
             recipient=self.request.user
-        ).order_by('-timestamp')[:20]
+        ).select_related('actor')
 
 class NotificationMarkReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def patch(self, request, pk):
         try:
-            notification = Notification.objects.get(pk=pk, recipient=request.user)
-            notification.is_read = True
-            notification.save()
-            data = {
-                "message": "Notification marked as read",
-                "notification": NotificationSerializer(notification).data,
-            }
-
-            if notification.appointment:
-                data["appointment"] = AppointmentSerializer(notification.appointment).data
-
-            return Response(data, status=status.HTTP_200_OK)
+            notification = Notification.objects.select_related(
+                'actor', 'appointment__pet', 'appointment__user', 'appointment__doctor'
+            ).get(pk=pk, recipient=request.user)
         except Notification.DoesNotExist:
             return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
 
+        with transaction.atomic():
+            # Only the request that actually flips the row moves the counter
+            if Notification.objects.filter(pk=pk, is_read=False).update(is_read=True):
+                queue_unread_count(request.user.id, UnreadCounter.add(request.user.id, -1))
+        notification.is_read = True
+        data = {
+            "message": "Notification marked as read",
+            "notification": NotificationSerializer(notification).data,
+        }
+
+        if notification.appointment:
+            data["appointment"] = AppointmentSerializer(notification.appointment).data
+
+        return Response(data, status=status.HTTP_200_OK)
+
+class BulkMarkReadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def patch(self, request):
+        serializer = MarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        owned = Notification.objects.filter(recipient=request.user, pk__in=ids)
+
+        with transaction.atomic():
+            marked = owned.filter(is_read=False).update(is_read=True)
+            if marked:
+                queue_unread_count(request.user.id, UnreadCounter.add(request.user.id, -marked))
+
+        notifications = list(owned.select_related('actor').order_by('-timestamp', '-id'))
+        # One query for every appointment the notifications refer to, with what their payloads show
+        appointment_ids = {pk for notification in notifications for pk in notification.appointment_ids}
+        rows = AppointmentReadSerializer.values(Appointment.objects.filter(pk__in=appointment_ids))
+        appointments = AppointmentReadSerializer()
+        by_id = {row[0]: appointments.to_representation(row) for row in rows}
+
+        results = []
+        for notification in notifications:
+            data = NotificationSerializer(notification).data
+            data["appointment"] = by_id.get(notification.appointment_id)
+            data["appointments"] = [by_id[pk] for pk in notification.appointment_ids if pk in by_id]
+            results.append(data)
+
+        return Response({
+            "message": f"{marked} notifications marked as read",
+            "marked": marked,
+            "notifications": results,
+        }, status=status.HTTP_200_OK)
+
 class MarkAllNotificationsReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
-        return Response({"message": "All notifications marked as read"}, status=200)
\ No newline at end of file
+        with transaction.atomic():
+            marked = Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+            if marked:
+                queue_unread_count(request.user.id, UnreadCounter.add(request.user.id, -marked))
+        return Response({"message": "All notifications marked as read"}, status=200)
+
+class UnreadCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread_count": UnreadCounter.get(request.user.id)})
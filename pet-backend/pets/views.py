@@ -4,9 +4,12 @@ from rest_framework.response import Response
 from .models import Pet
 from .serializers import PetSerializer
 from utils.auth import get_safe_user
+from utils.pagination import KeysetPagination
 class PetViewSet(viewsets.ModelViewSet):
     serializer_class = PetSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'id')
 
     def get_queryset(self):
         user = get_safe_user(self)
@@ -37,11 +37,24 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Part of the signed calendar feed token; changing it revokes every link issued so far
+    calendar_secret = models.CharField(max_length=32, blank=True)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['firstname', 'lastname']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets post_save receivers see a role change, e.g. a doctor demoted
+        instance._loaded_role = instance.role if 'role' in field_names else None
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_role = self.role
+
     def __str__(self):
         return f"{self.firstname} ({self.role})"
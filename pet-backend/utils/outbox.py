@@ -0,0 +1,65 @@
+from datetime import timedelta
+from django.db import models, transaction
+from django.utils import timezone
+
+# Claimed rows are hidden from other dispatchers for this long while a send is in flight
+CLAIM_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 6 * 60 * 60
+
+
+class OutboxEntry(models.Model):
+    """
+    Base for transactional outbox tables: rows are written in the same
+    transaction as the change they announce and removed by a dispatcher once
+    the external call succeeded, so delivery is at-least-once. Failed rows
+    are retried with exponential backoff.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        abstract = True
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after `attempts` failed ones."""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim_batch(model, fields, batch_size, now):
+    """
+    Claims up to batch_size due rows by moving their next_attempt_at past the
+    claim period, so concurrent dispatchers skip them and a crashed
+    dispatcher's rows come back on their own.
+
+    Returns value tuples of (id, attempts, *fields), oldest first.
+    """
+    with transaction.atomic():
+        rows = list(
+            model.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', 'attempts', *fields)[:batch_size]
+        )
+        if rows:
+            model.objects.filter(pk__in=[row[0] for row in rows]).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+            )
+    return rows
+
+
+def record_failures(model, failures, now):
+    """
+    Reschedules failed rows with backoff from [(id, attempts so far, error)],
+    with one UPDATE per distinct (attempts, error).
+    """
+    grouped = {}
+    for pk, attempts, error in failures:
+        grouped.setdefault((attempts + 1, str(error)[:1000]), []).append(pk)
+    for (attempts, error), pks in grouped.items():
+        model.objects.filter(pk__in=pks).update(
+            attempts=attempts, next_attempt_at=now + retry_delay(attempts), last_error=error
+        )
@@ -0,0 +1,172 @@
+import base64
+import bisect
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row of the previous page with a
+    tuple comparison on the view's keyset ordering, e.g. (date, time, id),
+    instead of an OFFSET, so every page costs the same however deep it is.
+
+    Views declare keyset_ordering (or get_keyset_ordering()); the last field
+    must be unique. '-field' sorts descending, and NULLs always sort last.
+    Fields may also name non-null annotations on the queryset, e.g. a rank.
+
+    Sorting NULLs last costs an index on a nullable field, so views whose
+    queryset already excludes its NULLs list it in keyset_not_null, and it
+    is ordered and sought like a non-null column.
+    """
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering())
+        return tuple(getattr(view, 'keyset_ordering', ('pk',)))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size_value = self.get_page_size(request)
+        self.model = queryset.model
+        self.not_null = set(getattr(view, 'keyset_not_null', ()))
+
+        queryset = queryset.order_by(*[self.order_expression(field) for field in self.ordering])
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.seek_filter(self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        page = rows[:self.page_size_value]
+        self.next_position = [self.field_value(page[-1], field) for field in self.ordering] if page else None
+        return page
+
+    def paginate_sorted(self, keyed_items, request, view=None):
+        """
+        Paginates a list of (key, item) pairs already sorted by key, for
+        orderings computed in Python rather than by the database (e.g. a
+        distance). Keys are tuples matching the view's keyset ordering, and
+        cursors work exactly as for querysets.
+        """
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size_value = self.get_page_size(request)
+
+        start = 0
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = tuple(self.decode_cursor(cursor))
+            try:
+                start = bisect.bisect_right([key for key, _ in keyed_items], position)
+            except TypeError:
+                raise NotFound(self.invalid_cursor_message)
+
+        page = keyed_items[start:start + self.page_size_value]
+        self.has_next = start + self.page_size_value < len(keyed_items)
+        self.next_position = list(page[-1][0]) if page else None
+        return [item for _, item in page]
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        payload = json.dumps(position, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @staticmethod
+    def split(field):
+        return (field[1:], True) if field.startswith('-') else (field, False)
+
+    def model_field(self, name):
+        """The model field behind an ordering name, or None for pk and annotations."""
+        if name == 'pk':
+            return None
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def is_nullable(self, name):
+        field = self.model_field(name)
+        return field is not None and field.null and name not in self.not_null
+
+    def order_expression(self, field):
+        name, descending = self.split(field)
+        if not self.is_nullable(name):
+            return field
+        return F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+
+    def field_value(self, obj, field):
+        name, _ = self.split(field)
+        model_field = self.model_field(name)
+        return getattr(obj, model_field.attname if model_field else name)
+
+    def seek_filter(self, position):
+        """
+        Builds (f1, f2, ..., fn) > (v1, v2, ..., vn) in the keyset order as
+        f1 > v1 OR (f1 = v1 AND f2 > v2) OR ..., plus a redundant f1 >= v1
+        bound so the database can range-scan an index on the leading field.
+        """
+        condition = Q(pk__in=[])
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, position):
+            name, descending = self.split(field)
+            nullable = self.is_nullable(name)
+            if value is None:
+                after = Q(pk__in=[])
+                equal = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+                if nullable:
+                    after |= Q(**{f'{name}__isnull': True})
+                equal = Q(**{name: value})
+            condition |= equal_so_far & after
+            equal_so_far &= equal
+
+        name, descending = self.split(self.ordering[0])
+        if position[0] is not None and not self.is_nullable(name):
+            condition &= Q(**{f'{name}__{"lte" if descending else "gte"}': position[0]})
+        return condition
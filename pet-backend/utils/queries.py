@@ -0,0 +1,66 @@
+import logging
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """execute_wrapper callable that counts the queries run through the connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    """
+    Viewset mixin that applies the relations its serializer reads and keeps
+    each action within a fixed number of queries, however many rows it returns.
+
+    - select_related_fields / prefetch_related_fields are applied in
+      filter_queryset(), so list, retrieve and custom actions that call
+      self.filter_queryset() all get them.
+    - query_budgets maps an action name to its maximum number of queries.
+      Going over logs a warning, or raises QueryBudgetExceeded when
+      settings.QUERY_BUDGET_STRICT is on (utils.test_runner turns it on for tests).
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    query_budgets = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.select_related_fields:
+            queryset = queryset.select_related(*self.select_related_fields)
+        if self.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*self.prefetch_related_fields)
+        return queryset
+
+    def dispatch(self, request, *args, **kwargs):
+        # self.action is only set inside dispatch(), so resolve it from the action map here
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        budget = self.query_budgets.get(action)
+        if budget is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+
+        if counter.count > budget:
+            message = (
+                f"{self.__class__.__name__}.{action} ran {counter.count} queries, "
+                f"over its budget of {budget}."
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
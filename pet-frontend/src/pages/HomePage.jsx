@@ -135,7 +135,7 @@ export default function Home() {
           { headers }
         );
         setNotifications(
-          notificationsResponse.data.map((note) => ({
+          (notificationsResponse.data.results || notificationsResponse.data).map((note) => ({
             id: note.id,
             message: `${note.actor} ${note.verb} ${note.target}`,
             time: note.timestamp || new Date().toLocaleTimeString(),
@@ -33,7 +33,8 @@ export default function PetList() {
           }
         );
 
-        setPets(response.data);
+        // Handle paginated or non-paginated response
+        setPets(response.data.results ? response.data.results : response.data);
         setLoading(false);
       } catch (err) {
         console.error("Fetch pets error:", err.response?.data || err.message);